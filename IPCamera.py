@@ -1,21 +1,63 @@
 from sys import argv
 import json
+import logging
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
+from urllib3.util.retry import Retry
+import metrics
+
+CAMERA_REQUESTS = metrics.counter('ops_radar_camera_requests_total',
+    'overlay updates posted to cameras, by HTTP status (or error)', labels=('status',))
+CAMERA_REQUEST_SECONDS = metrics.histogram('ops_radar_camera_request_seconds',
+    'time taken by an overlay update, retries included')
+CAMERA_UPDATES = metrics.counter('ops_radar_camera_updates_total',
+    'calls of update_overlay, by what became of them (posted, unchanged, deferred)', labels=('result',))
 
 class IPCamera:
     payload = {}
     overlay_url = "http://4.3.2.1/webcall.cgi"
     headers = {"Content-Type": "application/json"}
     auth = HTTPDigestAuth('user','password')
+    connect_timeout = 2.0   # secs to wait for the camera to accept a connection
+    read_timeout = 5.0      # secs to wait for the camera to answer
+    retries = 2             # retries on connection errors and 502/503/504
+    retry_backoff = 0.2     # secs; doubles on every retry
+    pool_size = 2           # keep-alive connections kept open to the camera
+    min_update_interval = 1.0   # secs between overlay posts by update_overlay (at most 1/s); 0 for no limit
 
     def __init__(self, **kwargs):
         for key,value in kwargs.items():
             if key == "overlay_url":
                 self.overlay_url = value
+            elif key in ("auth", "connect_timeout", "read_timeout", "retries", "retry_backoff", "pool_size",
+                         "min_update_interval"):
+                setattr(self, key, value)
             # elif key == any others, then set
             # note that text and colors are set via update....
 
+        # one session per camera: the connection is kept alive and the digest auth
+        # nonce is reused, so an overlay update is a single round trip
+        # (instead of connect + 401 challenge + authorized post every time)
+        if isinstance(self.auth, HTTPDigestAuth):
+            # digest auth keeps nonce state, which must not be shared between cameras
+            self.auth = HTTPDigestAuth(self.auth.username, self.auth.password)
+        self.session = self.make_session()
+
+        # what the camera is showing, as (text, textColor, textBGColor), None if not known
+        self.displayed = None
+        self._pending = None         # the latest overlay not yet posted because of min_update_interval
+        self._pending_due = None     # time.monotonic() at which _pending is to be posted
+        self._last_post_time = None  # time.monotonic() of the last post by update_overlay
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        # posts held back overlays.  one long lived thread, as digest auth keeps its nonce per
+        # thread: a new thread for every post would be challenged (two requests) every time
+        self._trailing = None
+        self._closed = False
+
         self.overlay_payload = {
             "apiVersion": "1.0",
             "context": "321",
@@ -64,13 +106,111 @@ class IPCamera:
         self.overlay_payload["params"]["text"] = val
         return self.overlay_payload
 
+    def update_overlay(self, val):
+        """show val (see update_overlay_payload_for_val), posting only what changes the overlay
+
+        an overlay the same as the one shown is not posted.  posts are at least
+        min_update_interval apart: one that comes sooner is held back and posted when the
+        interval is up (a newer one replaces it meanwhile), so the final value is always shown.
+        returns True if posted now
+        """
+        with self._lock:
+            params = self.update_overlay_payload_for_val(val)["params"]
+            overlay = (params["text"], params["textColor"], params["textBGColor"])
+            if self._pending_due is not None:   # a post is due soon anyway; it will show this one
+                self._pending = overlay
+                CAMERA_UPDATES.labels('deferred').inc()
+                return False
+            if overlay == self.displayed:
+                CAMERA_UPDATES.labels('unchanged').inc()
+                return False
+            now = time.monotonic()
+            if self._last_post_time is not None and now < self._last_post_time + self.min_update_interval:
+                self._pending = overlay
+                self._pending_due = self._last_post_time + self.min_update_interval
+                if self._trailing is None:
+                    self._trailing = threading.Thread(target=self._run_trailing, daemon=True,
+                                                      name=f'camera-overlay {self.overlay_url}')
+                    self._trailing.start()
+                self._wakeup.notify()
+                CAMERA_UPDATES.labels('deferred').inc()
+                return False
+            self._post(overlay)
+            return True
+
+    def _post(self, overlay):
+        # called with _lock held, so posts go out in order and displayed stays true
+        self.overlay_payload["params"]["text"], self.overlay_payload["params"]["textColor"], \
+            self.overlay_payload["params"]["textBGColor"] = overlay
+        self._last_post_time = time.monotonic()
+        self.displayed = None   # unknown until the camera says it took it
+        CAMERA_UPDATES.labels('posted').inc()
+        r = self.send_overlay_payload()
+        if r.ok:
+            self.displayed = overlay
+        else:
+            logging.warning(f"camera {self.overlay_url} answered {r.status_code} to an overlay update")
+        return r
+
+    def _post_pending(self):
+        # called with _lock held
+        overlay, self._pending, self._pending_due = self._pending, None, None
+        if overlay is None or overlay == self.displayed:
+            return
+        try:
+            self._post(overlay)
+        except requests.RequestException as e:
+            logging.warning(f"camera {self.overlay_url} overlay update failed: {e}")
+
+    def _run_trailing(self):
+        with self._lock:
+            while not self._closed:
+                if self._pending_due is None:
+                    self._wakeup.wait()
+                    continue
+                wait = self._pending_due - time.monotonic()
+                if wait > 0:
+                    self._wakeup.wait(wait)
+                    continue
+                self._post_pending()
+
+    def make_session(self):
+        """a requests session with a keep-alive connection pool and bounded retries"""
+        retry = Retry(total=self.retries,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["POST"]),  # setText is idempotent, so a POST can be retried
+            raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.auth = self.auth
+        session.headers.update(self.headers)
+        return session
+
     def send_overlay_payload(self):
-        r = requests.post(self.overlay_url, 
-            auth = self.auth, 
-            headers = self.headers, 
-            json = self.overlay_payload)
+        started = time.perf_counter()
+        status = 'error'  # no answer (connection refused, timeout, ...)
+        try:
+            r = self.session.post(self.overlay_url,
+                json = self.overlay_payload,
+                timeout = (self.connect_timeout, self.read_timeout))
+            status = r.status_code
+        finally:
+            CAMERA_REQUEST_SECONDS.observe(time.perf_counter() - started)
+            CAMERA_REQUESTS.labels(status).inc()
         return r
 
+    def close(self):
+        """post the overlay held back by update_overlay, if any, and close the pooled connections to the camera"""
+        with self._lock:
+            if self._pending_due is not None:
+                self._post_pending()
+            self._closed = True
+            self._wakeup.notify()
+        self.session.close()
+
 if __name__ == "__main__":
     cam = IPCamera()
     if len(argv)==1:
@@ -79,10 +219,7 @@ if __name__ == "__main__":
         print("calling update with:",argv[1])
         cam.update_overlay_payload_for_val(argv[1])
         
-    r = requests.post(cam.overlay_url, 
-        auth = cam.auth, 
-        headers = cam.headers, 
-        json = cam.overlay_payload)
+    r = cam.send_overlay_payload()
     import pdb; pdb.set_trace()
     print("camera returned:",r)
 
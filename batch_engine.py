@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: vectorized (NumPy) tracking of recorded speeds, for re-scoring recordings
+#
+# BatchTracker produces the same Events as tracker.Tracker.feed_many, but works on
+# whole arrays of readings at once instead of one reading at a time:
+#   - validity (is_speed_in_allowed) and direction change are elementwise masks
+#   - the tracking episodes (from a valid speed while not tracking, to the out of range
+#     reading that exceeds TARGETLESS_MIN_INTERVAL_TIME) are found from precomputed
+#     expiry masks; only a cheap loop over the episodes remains
+#   - each episode is split at its direction changes into targets, and acquisition
+#     (MIN_TRACK_TO_ACQUIRED_TIME), acceleration and the running target stats are
+#     computed per target with cumulative sums
+# A sweep evaluates many threshold combinations on one load of the recordings,
+# sharing the masks between the combinations that have them in common.
+#
+# python batch_engine.py capture.txt ... [--min-speed 10 --max-speed 75 ...] [--parity]
+# python batch_engine.py capture.txt --sweep min_speed=8,10,12 targetless_min_interval=0.5,0.75,1
+#
+# NumPy is only needed for this module (pip install numpy), not for ops_radar.
+#####################################################
+import argparse
+import itertools
+import time
+
+try:
+    import numpy as np
+except ImportError:   # the rest of ops_radar works without it
+    np = None
+
+import line_parser
+import sensor_source
+import tracker
+
+PARAMETERS = ('min_speed', 'max_speed', 'idle_notice_interval', 'targetless_min_interval', 'min_track_to_acquired')
+DEFAULTS = dict(min_speed=10, max_speed=75, idle_notice_interval=10.0,
+                targetless_min_interval=0.75, min_track_to_acquired=0.1)
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('batch_engine needs numpy (pip install numpy)')
+
+
+def load_capture(path):
+    """(timestamps, velocities) arrays of the speeds in a capture file (see sensor_source.py)
+
+    lines are parsed exactly as when the capture is replayed (line_parser.LineReader)
+    """
+    require_numpy()
+    reader = line_parser.LineReader(sensor_source.SensorSource(), name='batch')
+    times, velocities = [], []
+    with open(path, 'rb') as capture:
+        for record in capture:
+            recorded_time, _, line = record.rstrip(b'\r\n').partition(b' ')
+            if not recorded_time.strip():
+                continue
+            for timestamp, velocity, magnitude in reader.parse_lines([line], float(recorded_time)):
+                times.append(timestamp)
+                velocities.append(velocity)
+    return np.array(times, dtype=float), np.array(velocities, dtype=float)
+
+
+class Readings:
+    """the arrays that don't depend on any threshold, computed once per recording"""
+
+    def __init__(self, times, velocities):
+        require_numpy()
+        self.t = np.asarray(times, dtype=float)
+        self.v = np.asarray(velocities, dtype=float)
+        if len(self.t) > 1 and np.any(np.diff(self.t) < 0):
+            raise ValueError('timestamps must not go backwards')
+        self.n = len(self.v)
+        self.index = np.arange(self.n)
+        self.speed = np.abs(self.v)
+        positive = self.v > 0
+        negative = self.v < 0
+        # same direction as the reading before (the tracker starts with a prior velocity of 0)
+        self.same = np.zeros(self.n, dtype=bool)
+        self.same[1:] = (positive[1:] & positive[:-1]) | (negative[1:] & negative[:-1])
+        self._cache = {}
+
+    def cached(self, key, compute):
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache[key] = compute()
+        return value
+
+
+class BatchTracker:
+    """tracker.Tracker, for arrays of readings (see tracker.Tracker for the parameters)"""
+
+    def __init__(self, **parameters):
+        unknown = set(parameters) - set(PARAMETERS)
+        if unknown:
+            raise TypeError(f'unknown parameters {sorted(unknown)}')
+        self.parameters = dict(DEFAULTS, **parameters)
+        for name, value in self.parameters.items():
+            setattr(self, name, value)
+
+    def events(self, readings):
+        """the tracker.Events (targets' stats included) of Readings, in order"""
+        a = self.analyze(readings)
+        t, v = readings.t, readings.v
+        found = []   # (reading index, order at that reading, Event)
+        for i in a['idle']:
+            found.append((i, 0, tracker.Event('on_idle_notice_interval', (), float(t[i]))))
+        for i in a['acquired']:
+            found.append((i, 0, tracker.Event('on_target_acquired', (float(v[i]),), float(t[i]),
+                                              self._stats(a, a['position'][i]))))
+        for i in a['accelerating']:
+            found.append((i, 0, tracker.Event('on_target_accelerating', (float(v[i]),), float(t[i]),
+                                              self._stats(a, a['position'][i]))))
+        for i in a['direction_ended']:
+            found.append((i, 0, tracker.Event(tracker.TARGET_ENDED, ('direction',), float(t[i]),
+                                              self._stats(a, a['position'][i] - 1))))
+        for i in a['lost']:
+            stats = self._stats(a, np.searchsorted(a['valid_index'], i) - 1)
+            found.append((i, 0, tracker.Event('on_target_lost', (), float(t[i]), stats)))
+            found.append((i, 1, tracker.Event(tracker.TARGET_ENDED, ('lost',), float(t[i]), stats)))
+        found.sort(key=lambda item: item[:2])
+        return [event for _, _, event in found]
+
+    def summary(self, readings):
+        """counts of each event, and numbers of the targets that were acquired (no Event objects made)"""
+        a = self.analyze(readings)
+        ended = np.concatenate([a['position'][a['direction_ended']] - 1,
+                                np.searchsorted(a['valid_index'], a['lost']) - 1]).astype(int)
+        return {
+            'acquired': len(a['acquired']),
+            'accelerating': len(a['accelerating']),
+            'lost': len(a['lost']),
+            'idle_notices': len(a['idle']),
+            'direction_changes': len(a['direction_ended']),
+            'mean_peak': float(a['peak'][ended].mean()) if len(ended) else None,
+            'mean_readings': float(a['count'][ended].mean()) if len(ended) else None,
+        }
+
+    def analyze(self, r):
+        """the indexes of the readings at which each kind of event happens, and the targets' running stats"""
+        n, t, v = r.n, r.t, r.v
+        valid = r.cached(('valid', self.min_speed, self.max_speed),
+                         lambda: (self.min_speed < r.speed) & (r.speed < self.max_speed))
+        valid_index = np.flatnonzero(valid)
+        if not len(valid_index):   # nothing ever tracked
+            empty = np.zeros(0, dtype=int)
+            idle = self._idle_notices(r, empty, empty) if n else empty
+            return dict(idle=idle, acquired=empty, accelerating=empty, direction_ended=empty, lost=empty,
+                        valid_index=empty, position=empty, peak=np.zeros(0), count=empty)
+        starts, ends = r.cached(('episodes', self.min_speed, self.max_speed, self.targetless_min_interval),
+                                lambda: self._episodes(r, valid, valid_index))
+
+        # targets: each episode start, and each direction change inside an episode, starts one
+        is_start = np.zeros(n, dtype=bool)
+        is_start[starts] = True
+        marker = is_start | (valid & ~r.same)
+        target_of = np.cumsum(marker) - 1            # target each reading belongs to
+        target_first = np.flatnonzero(marker)        # reading that started each target
+        target_time = t[target_first][np.maximum(target_of, 0)]
+
+        # acquisition and acceleration happen on in-range readings in the same direction,
+        # once the target has been tracked for min_track_to_acquired
+        candidate = valid & r.same & ~is_start & (t - target_time > self.min_track_to_acquired)
+        candidates = np.flatnonzero(candidate)
+        candidate_target = target_of[candidates]
+        first = np.ones(len(candidates), dtype=bool)
+        first[1:] = candidate_target[1:] != candidate_target[:-1]
+        acquired = candidates[first]
+        rest = candidates[~first]
+        accelerating = rest[r.speed[rest] > r.speed[rest - 1]]
+        target_acquired = np.zeros(len(target_first), dtype=bool)
+        target_acquired[candidate_target[first]] = True
+
+        direction_changes = np.flatnonzero(marker & ~is_start)
+        direction_ended = direction_changes[target_acquired[target_of[direction_changes] - 1]]
+        ends = np.asarray(ends, dtype=int)
+        ends = ends[ends < n]
+        lost = ends[target_acquired[target_of[ends]]]
+
+        result = dict(idle=self._idle_notices(r, starts, ends), acquired=acquired, accelerating=accelerating,
+                      direction_ended=direction_ended, lost=lost, valid_index=valid_index, times=t, velocities=v)
+        result.update(self._running_stats(r, valid_index, target_of))
+        return result
+
+    def _episodes(self, r, valid, valid_index):
+        """(starts, ends) of the tracking episodes; an end of n means still tracking at the end"""
+        n, t = r.n, r.t
+        invalid = ~valid
+        # for each out of range reading: the in range reading before its run of out of range ones
+        before = np.maximum.accumulate(np.where(valid, r.index, -1))
+        run_first = before + 1
+        next_valid = np.minimum.accumulate(np.where(valid, r.index, n)[::-1])[::-1]
+        has_before = before >= 0
+        before_time = t[np.maximum(before, 0)]
+        # the targetless timer of a run starts at the reading before it if that began a target
+        # (a direction change, or the start of tracking), otherwise at the run's first reading
+        resets = has_before & valid[np.maximum(before, 0)] & ~r.same[np.maximum(before, 0)]
+        anchor = np.where(resets, before_time, t[np.minimum(run_first, n - 1)])
+        expiring = np.flatnonzero(invalid & (t - anchor > self.targetless_min_interval))
+        # the same, for a run right after the reading that started tracking
+        expiring_after_start = np.flatnonzero(invalid & has_before & (t - before_time > self.targetless_min_interval))
+
+        starts, ends = [], []
+        position = 0
+        while True:
+            p = np.searchsorted(valid_index, position)
+            if p == len(valid_index):
+                break
+            start = int(valid_index[p])
+            starts.append(start)
+            end = None
+            after = start
+            if start + 1 < n and invalid[start + 1]:
+                run_last = next_valid[start + 1] - 1
+                q = np.searchsorted(expiring_after_start, start + 1)
+                if q < len(expiring_after_start) and expiring_after_start[q] <= run_last:
+                    end = int(expiring_after_start[q])
+                after = run_last
+            if end is None:
+                q = np.searchsorted(expiring, after, side='right')
+                if q == len(expiring):
+                    ends.append(n)
+                    break
+                end = int(expiring[q])
+            ends.append(end)
+            position = end + 1
+        return np.array(starts, dtype=int), np.array(ends, dtype=int)
+
+    def _idle_notices(self, r, starts, ends):
+        """readings at which idle notices are due, while not tracking"""
+        if self.idle_notice_interval <= 0:
+            return np.zeros(0, dtype=int)
+        t, n = r.t, r.n
+        # the idle gaps: (first reading, last reading + 1, time the idle timer started)
+        gaps = [(0, starts[0] if len(starts) else n, t[0])]
+        for k, end in enumerate(ends):
+            gaps.append((end + 1, starts[k + 1] if k + 1 < len(starts) else n, t[end]))
+        notices = []
+        interval = self.idle_notice_interval
+        for first, stop, since in gaps:
+            i = first
+            while i < stop:
+                # the first reading with t - since > interval (compared as the tracker does)
+                i = max(i, int(np.searchsorted(t, since + interval, side='left')) - 1, first)
+                while i < stop and not t[i] - since > interval:
+                    i += 1
+                if i < stop:
+                    notices.append(i)
+                    since = t[i]
+                    i += 1
+        return np.array(notices, dtype=int)
+
+    def _running_stats(self, r, valid_index, target_of):
+        """count, peak, mean and m2 (see tracker.TargetStats) of each target as of each in range reading"""
+        speed = r.speed[valid_index]
+        target = target_of[valid_index]
+        first = np.searchsorted(target, target)   # position of each target's first reading
+        positions = np.arange(len(valid_index))
+        count = positions - first + 1
+        # sums of the speeds less the target's first speed, restarted with each target, so they
+        # stay as small as one target's and a long recording doesn't cost them their precision
+        starts = np.flatnonzero(first == positions)
+        change = speed - speed[first]
+        total = _cumsum_by_segment(change, starts)
+        squares = _cumsum_by_segment(change * change, starts)
+        mean = speed[first] + total / count
+        m2 = np.maximum(squares - total * total / count, 0.0)
+        # running max that restarts with each target: offset the speeds by target, then look them up
+        offset = float(speed.max()) * 2 + 1 if len(speed) else 1.0
+        keyed = target * offset + speed
+        best = np.maximum.accumulate(keyed)
+        peak_at = np.maximum.accumulate(np.where(keyed == best, positions, 0))
+        position = np.zeros(r.n, dtype=int)
+        position[valid_index] = positions
+        return dict(count=count, peak=speed[peak_at], mean=mean, m2=m2, first=first, position=position)
+
+    @staticmethod
+    def _stats(a, p):
+        """tracker.TargetStats as of position p (an index into valid_index)"""
+        first = a['valid_index'][a['first'][p]]
+        stats = tracker.TargetStats.__new__(tracker.TargetStats)
+        stats.first_time = float(a['times'][first])
+        stats.last_time = float(a['times'][a['valid_index'][p]])
+        stats.count = int(a['count'][p])
+        stats.peak = float(a['peak'][p])
+        stats.mean = float(a['mean'][p])
+        stats._m2 = float(a['m2'][p])
+        stats.direction = 1 if a['velocities'][first] > 0 else -1
+        return stats
+
+
+def _cumsum_by_segment(values, starts):
+    """running sums of values, restarting at each of starts (the first must be 0)"""
+    if not len(values):
+        return values.copy()
+    restarts = np.zeros(len(values))
+    restarts[starts[1:]] = -np.add.reduceat(values, starts)[:-1]   # less the previous segment's sum
+    sums = np.cumsum(values + restarts)
+    return sums - (sums[starts] - values[starts]).repeat(np.diff(np.append(starts, len(values))))
+
+
+def same_events(expected, found, tolerance=1e-6):
+    """None if two lists of Events match (stats to within tolerance), else a description of the first difference"""
+    for k, (a, b) in enumerate(itertools.zip_longest(expected, found)):
+        if a is None or b is None or a[:3] != b[:3]:
+            return f'event {k}: expected {a}, got {b}'
+        if (a.stats is None) != (b.stats is None):
+            return f'event {k}: stats expected {a.stats}, got {b.stats}'
+        if a.stats is not None:
+            for name in ('first_time', 'last_time', 'count', 'peak', 'direction', 'mean', 'variance'):
+                x, y = getattr(a.stats, name), getattr(b.stats, name)
+                if abs(x - y) > tolerance * max(1.0, abs(x)):
+                    return f'event {k} {a.name}: stats.{name} expected {x}, got {y}'
+    return None
+
+
+def check_parity(times, velocities, **parameters):
+    """compare BatchTracker with tracker.Tracker on the readings.  None if they agree, else the first difference"""
+    expected = tracker.Tracker(**parameters).feed_many(zip(velocities.tolist(), times.tolist()))
+    return same_events(expected, BatchTracker(**parameters).events(Readings(times, velocities)))
+
+
+def sweep(readings, grid):
+    """BatchTracker.summary for every combination of the parameter values in grid ({name: [values]})
+
+    returns a list of (parameters, summary).  masks shared by combinations are computed once.
+    """
+    names = list(grid)
+    results = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        parameters = dict(zip(names, values))
+        results.append((parameters, BatchTracker(**parameters).summary(readings)))
+    return results
+
+
+def parse_sweep(specs):
+    """['min_speed=8,10,12', ...] -> {'min_speed': [8.0, 10.0, 12.0], ...}"""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in PARAMETERS:
+            raise SystemExit(f'unknown parameter {name!r}; one of {", ".join(PARAMETERS)}')
+        grid[name] = [float(value) for value in values.split(',')]
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='vectorized tracking of recorded speeds (capture files)')
+    parser.add_argument('captures', metavar='capture', nargs='+', help='capture file(s), see --capture of ops_radar.py')
+    for name in PARAMETERS:
+        parser.add_argument('--' + name.replace('_', '-'), type=float, default=DEFAULTS[name])
+    parser.add_argument('--parity', action='store_true',
+                        help='also run tracker.Tracker and check that the events are the same')
+    parser.add_argument('--sweep', nargs='+', metavar='NAME=V1,V2,...',
+                        help='summarize every combination of these parameter values (others as given)')
+    args = parser.parse_args()
+    parameters = {name: getattr(args, name) for name in PARAMETERS}
+    for path in args.captures:
+        times, velocities = load_capture(path)
+        readings = Readings(times, velocities)
+        print(f'{path}: {len(times)} speeds')
+        if args.sweep:
+            grid = {name: [value] for name, value in parameters.items()}
+            grid.update(parse_sweep(args.sweep))
+            swept = list(parse_sweep(args.sweep))
+            for combination, summary in sweep(readings, grid):
+                print('  ' + ' '.join(f'{name}={combination[name]:g}' for name in swept), summary)
+            continue
+        started = time.perf_counter()
+        summary = BatchTracker(**parameters).summary(readings)
+        print(f'  {summary} ({(time.perf_counter() - started) * 1000:.1f} ms)')
+        if args.parity:
+            difference = check_parity(times, velocities, **parameters)
+            print('  parity with tracker.Tracker: ' + ('ok' if difference is None else difference))
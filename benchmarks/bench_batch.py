@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: parity and speed of the vectorized batch engine (batch_engine.py)
+#
+# Synthetic recordings (quiet and busy roads, clean and glitchy readings) are tracked
+# with tracker.Tracker and with batch_engine.BatchTracker, over a range of thresholds
+# including edge cases; every event (and the target stats it carries) must match.
+# A long recording (--long-readings, at one decimal, as the sensor reports with F1)
+# checks that the target stats keep their precision over hours of readings.
+# Reported, as JSON: parity failures (there should be none), readings/sec of each,
+# and the time of a parameter sweep.  Exits with status 1 if any parity check fails.
+#
+# python benchmarks/bench_batch.py [--readings N] [--long-readings N] [--output results.json]
+#####################################################
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import batch_engine
+import sensor_source
+import tracker
+
+RECORDINGS = {   # name: SyntheticSource options
+    'busy': dict(mean_gap=1.0),
+    'quiet': dict(mean_gap=30.0),
+    'glitchy': dict(mean_gap=3.0, glitch_rate=0.1, noise=4.0),
+    'slow': dict(mean_gap=5.0, min_speed=5.0, max_speed=20.0, noise=3.0),
+}
+PARAMETER_SETS = [
+    {},
+    dict(min_speed=12, max_speed=50),
+    dict(idle_notice_interval=1.0),
+    dict(idle_notice_interval=0),
+    dict(targetless_min_interval=0.0, min_track_to_acquired=0.0),
+    dict(targetless_min_interval=0.05, min_track_to_acquired=0.05),
+    dict(targetless_min_interval=3.0, min_track_to_acquired=1.0),
+    dict(min_speed=0, max_speed=1000, idle_notice_interval=0.5),
+]
+
+
+def synthetic_readings(count, seed, **options):
+    source = sensor_source.SyntheticSource(seed=seed, lines=count, **options)
+    times, velocities = [], []
+    try:
+        while True:
+            velocities.append(float(source.readline()))
+            times.append(source.timestamp())
+    except EOFError:
+        pass
+    return times, velocities
+
+
+def main():
+    parser = argparse.ArgumentParser(description='batch engine parity and speed')
+    parser.add_argument('--readings', type=int, default=200000, help='readings per recording')
+    parser.add_argument('--long-readings', type=int, default=3000000,
+                        help='readings of the long recording (0 to skip it)')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    results = {
+        'benchmark': 'batch engine',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'readings': args.readings,
+        'long_readings': args.long_readings,
+        'parity_checks': 0,
+        'parity_failures': [],
+        'recordings': {},
+    }
+    for seed, (name, options) in enumerate(RECORDINGS.items()):
+        times, velocities = synthetic_readings(args.readings, seed, **options)
+        t, v = batch_engine.np.array(times), batch_engine.np.array(velocities)
+        for parameters in PARAMETER_SETS:
+            difference = batch_engine.check_parity(t, v, **parameters)
+            results['parity_checks'] += 1
+            if difference is not None:
+                results['parity_failures'].append({'recording': name, 'parameters': parameters,
+                                                   'difference': difference})
+
+        start = time.perf_counter()
+        expected = tracker.Tracker().feed_many(zip(velocities, times))
+        tracker_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        summary = batch_engine.BatchTracker().summary(batch_engine.Readings(t, v))
+        batch_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        batch_engine.BatchTracker().events(batch_engine.Readings(t, v))
+        events_seconds = time.perf_counter() - start
+
+        grid = dict(min_speed=[8, 10, 12, 15], max_speed=[60, 75],
+                    targetless_min_interval=[0.5, 0.75, 1.0], min_track_to_acquired=[0.1, 0.2, 0.5])
+        readings = batch_engine.Readings(t, v)
+        start = time.perf_counter()
+        swept = batch_engine.sweep(readings, grid)
+        sweep_seconds = time.perf_counter() - start
+        results['recordings'][name] = {
+            'events': len(expected),
+            'summary': summary,
+            'tracker_readings_per_sec': len(times) / tracker_seconds,
+            'batch_summary_readings_per_sec': len(times) / batch_seconds,
+            'batch_events_readings_per_sec': len(times) / events_seconds,
+            'sweep_combinations': len(swept),
+            'sweep_seconds': sweep_seconds,
+            'sweep_tracker_seconds_estimate': tracker_seconds * len(swept),
+        }
+
+    if args.long_readings:
+        # a busy road for about 40 hours; speeds with a decimal are not exact as floats, unlike whole ones
+        times, velocities = synthetic_readings(args.long_readings, len(RECORDINGS), **RECORDINGS['busy'])
+        t = batch_engine.np.array(times)
+        v = batch_engine.np.round(batch_engine.np.array(velocities) * 1.07, 1)
+        difference = batch_engine.check_parity(t, v)
+        results['parity_checks'] += 1
+        if difference is not None:
+            results['parity_failures'].append({'recording': 'long', 'parameters': {}, 'difference': difference})
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+    if results['parity_failures']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: what the event dispatcher (event_dispatch.py) drops when its handler falls behind
+#
+# A handler that blocks until released is given busy traffic: each target acquired,
+# then many accelerating/decelerating events, then lost, more than the queue holds.
+# Every acquired and lost event should still reach the handler, while accelerating/
+# decelerating events make room for them.  The queue is then filled with acquired/lost
+# events alone, where some have to go.  Reported, as JSON: events sent, handled and
+# dropped per type in each case, and the time dispatch() takes with a full queue.
+# Exits with status 1 if an acquired or lost event was dropped while others were queued.
+#
+# python benchmarks/bench_dispatch.py [--targets N] [--max-pending N] [--output results.json]
+#####################################################
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import event_dispatch
+
+KEPT = ('on_target_acquired', 'on_target_lost')
+
+
+class BlockedHandlers:
+    """counts the calls; the first call waits until release()"""
+
+    def __init__(self):
+        self.handled = collections.Counter()
+        self.started = threading.Event()
+        self._released = threading.Event()
+
+    def release(self):
+        self._released.set()
+
+    def _handle(self, name):
+        self.started.set()
+        self._released.wait()
+        self.handled[name] += 1
+
+    def on_target_acquired(self, velocity):
+        self._handle('on_target_acquired')
+
+    def on_target_accelerating(self, velocity):
+        self._handle('on_target_accelerating')
+
+    def on_target_decelerating(self, velocity):
+        self._handle('on_target_decelerating')
+
+    def on_target_lost(self, velocity):
+        self._handle('on_target_lost')
+
+
+def run(events, max_pending):
+    """dispatch the (name, velocity) events while the handler is blocked, then let it catch up"""
+    handlers = BlockedHandlers()
+    dispatcher = event_dispatch.EventDispatcher(handlers, max_pending=max_pending, name='bench-dispatch')
+    dispatcher.dispatch('on_idle_notice_interval')   # taken by the worker, which then blocks
+    dispatcher.dispatch('on_target_decelerating', 0.0)
+    handlers.started.wait()
+    sent = collections.Counter(name for name, velocity in events)
+    start = time.perf_counter()
+    for name, velocity in events:
+        dispatcher.dispatch(name, velocity)
+    seconds = time.perf_counter() - start
+    handlers.release()
+    dispatcher.close()
+    handlers.handled['on_target_decelerating'] -= 1   # the one that blocked
+    return {
+        'sent': dict(sent),
+        'handled': {name: handlers.handled[name] for name in sent},
+        'dropped': dict(dispatcher.dropped),
+        'dispatch_us': seconds / len(events) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='events dropped by the dispatcher when its handler falls behind')
+    parser.add_argument('--targets', type=int, default=10, help='targets acquired and lost while the handler is blocked')
+    parser.add_argument('--max-pending', type=int, default=32, help='events the dispatcher queues')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+    if 2 * args.targets > args.max_pending:
+        parser.error('the queue must have room for every acquired and lost event (2 * targets <= max-pending)')
+
+    busy = []
+    for target in range(args.targets):
+        busy.append(('on_target_acquired', float(target)))
+        for change in range(args.max_pending):   # alternating, so they aren't merged
+            busy.append(('on_target_accelerating' if change % 2 else 'on_target_decelerating', float(change)))
+        busy.append(('on_target_lost', float(target)))
+    only_kept = [(name, float(target)) for target in range(args.max_pending) for name in KEPT]
+
+    results = {
+        'benchmark': 'event dispatch overflow',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'max_pending': args.max_pending,
+        'busy_traffic': run(busy, args.max_pending),
+        'acquired_lost_only': run(only_kept, args.max_pending),
+    }
+    busy = results['busy_traffic']
+    results['acquired_lost_kept'] = all(busy['handled'][name] == busy['sent'][name] for name in KEPT)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+    if not results['acquired_lost_kept']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: cost to the tracking loop of publishing to many subscribers (fanout.py)
+#
+# Batches of synthetic readings, and their tracker events, are published as the
+# tracking loop publishes them, at --speedup times the sensor's rate, to 0, 1, 8, 32
+# and 64 subscribers (each a process using fanout.Subscriber), plus one that never reads.
+# Reported, as JSON, per number of subscribers: the time the publish calls took the
+# tracking loop per batch (wall time, and its own CPU time: with few cores the wall time
+# includes waiting for the subscribers' processes to be scheduled), whether every subscriber got every message, and whether the
+# stalled subscriber was disconnected.
+#
+# python benchmarks/bench_fanout.py [--batches N] [--speedup X] [--output results.json]
+#####################################################
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fanout
+import sensor_source
+import tracker
+
+BATCH_READINGS = 20   # about a second of readings; the tracking loop takes whatever is waiting
+
+
+def synthetic_batches(count):
+    """[(readings, events)], the readings as IngestReader gives them"""
+    source = sensor_source.SyntheticSource(seed=1, mean_gap=1.0, lines=count * BATCH_READINGS)
+    track = tracker.Tracker()
+    batches = []
+    try:
+        while True:
+            readings, events = [], []
+            for _ in range(BATCH_READINGS):
+                velocity = float(source.readline())
+                readings.append((source.timestamp(), velocity, None))
+                events += track.feed(velocity, source.timestamp())
+            batches.append((readings, events))
+    except EOFError:
+        pass
+    return batches
+
+
+def subscribe(path):
+    """(run in a subscriber process) count the messages until the publisher closes"""
+    received = 0
+    with fanout.Subscriber(path) as published:
+        for _ in published:
+            received += 1
+    print(received)
+
+
+def run(batches, subscribers, speedup):
+    path = os.path.join(tempfile.mkdtemp(), 'fanout.sock')
+    publisher = fanout.Publisher(path, max_pending=64 * 1024).start()
+    processes = [subprocess.Popen([sys.executable, __file__, '--subscribe', path], stdout=subprocess.PIPE)
+                 for _ in range(subscribers)]
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)   # connects but never reads
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.connect(path)
+    while publisher.subscribers < subscribers + 1:
+        time.sleep(0.01)
+
+    interval = BATCH_READINGS / 20.0 / speedup
+    publishing = publishing_cpu = 0.0
+    messages = 0
+    start = time.perf_counter()
+    for index, (readings, events) in enumerate(batches):
+        delay = start + index * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        begin, begin_cpu = time.perf_counter(), time.thread_time()
+        publisher.publish_readings('synthetic', readings)
+        for event in events:
+            publisher.publish_event('synthetic', event)
+        publisher.flush()
+        publishing += time.perf_counter() - begin
+        publishing_cpu += time.thread_time() - begin_cpu
+        messages += 1 + len(events)
+    stats = publisher.stats()
+    publisher.close()
+    counts = [int(process.communicate(timeout=60)[0]) for process in processes]
+    stalled.close()
+    return {
+        'publish_us_per_batch': publishing / len(batches) * 1e6,
+        'publish_cpu_us_per_batch': publishing_cpu / len(batches) * 1e6,
+        'messages': messages,
+        'all_received': all(received == messages for received in counts),
+        'stalled_subscriber_dropped': stats['dropped'] == 1,
+        'publisher': stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cost of publishing to many subscribers')
+    parser.add_argument('--batches', type=int, default=2000, help='batches of readings to publish')
+    parser.add_argument('--speedup', type=float, default=50, help='publish this many times faster than realtime')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    parser.add_argument('--subscribe', metavar='SOCKET', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.subscribe:
+        subscribe(args.subscribe)
+        return
+
+    batches = synthetic_batches(args.batches)
+    results = {
+        'benchmark': 'fanout publishing',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'batches': len(batches),
+        'readings_per_batch': BATCH_READINGS,
+        'events': sum(len(events) for readings, events in batches),
+        'subscribers': {},
+    }
+    # with none, the stalled one is the only subscriber, until it is dropped
+    for subscribers in (0, 1, 8, 32, 64):
+        results['subscribers'][str(subscribers)] = run(batches, subscribers, args.speedup)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: events per vehicle with and without the speed filters (speed_filter.py)
+#
+# Synthetic traffic, with increasing rates of glitches (single spurious readings), is
+# tracked with no filter and with each filter in --filters.  Each vehicle ideally gives
+# one acquired and one lost event; every glitch that gets through can drop and
+# re-acquire a target or add an accelerating event, each a call to the handlers.
+# Reported, as JSON: per glitch rate and filter, the events (and acquired events) per
+# vehicle, tracking every filtered reading and tracking only those rated at least
+# --min-confidence (with the share of readings that skipped), and the cost of the
+# filter per reading.
+#
+# python benchmarks/bench_filter.py [--readings N] [--filters SPEC ...] [--min-confidence C] [--output results.json]
+#####################################################
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import sensor_source
+import speed_filter
+import tracker
+
+GLITCH_RATES = [0.0, 0.01, 0.05, 0.1]
+FILTERS = ['median:3', 'median:5', 'gate:20', 'gate:20,median:3', 'alphabeta:0.5:0.01', 'gate:20,alphabeta:0.5:0.01']
+
+
+def synthetic_readings(count, seed, glitch_rate):
+    """(velocity, timestamp) readings, and the number of vehicles in them"""
+    source = sensor_source.SyntheticSource(seed=seed, lines=count, glitch_rate=glitch_rate)
+    readings = []
+    try:
+        while True:
+            readings.append((float(source.readline()), source.timestamp()))
+    except EOFError:
+        pass
+    return readings, source.vehicle_count
+
+
+def filtered(readings, spec):
+    """((velocity, confidence), timestamp) of the readings through a new filter, and the secs it took"""
+    speeds = speed_filter.make_filter(spec)
+    if speeds is None:
+        return [((velocity, 1.0), timestamp) for velocity, timestamp in readings], 0.0
+    update = speeds.update
+    start = time.perf_counter()
+    results = [(update(velocity, timestamp), timestamp) for velocity, timestamp in readings]
+    return results, time.perf_counter() - start
+
+
+def tracked(results, vehicles, min_confidence):
+    """events per vehicle tracking the filtered readings rated at least min_confidence"""
+    readings = [(velocity, timestamp) for (velocity, confidence), timestamp in results if confidence >= min_confidence]
+    events = collections.Counter(event.name for event in tracker.Tracker().feed_many(readings)
+                                 if event.name not in ('on_idle_notice_interval', tracker.TARGET_ENDED))
+    return {
+        'events': dict(sorted(events.items())),
+        'events_per_vehicle': sum(events.values()) / vehicles,
+        'acquired_per_vehicle': events['on_target_acquired'] / vehicles,
+        'unconfident_share': 1 - len(readings) / len(results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='events per vehicle with and without the speed filters')
+    parser.add_argument('--readings', type=int, default=200000, help='readings per glitch rate')
+    parser.add_argument('--filters', nargs='+', default=FILTERS, metavar='SPEC', help='filters to compare')
+    parser.add_argument('--min-confidence', type=float, default=0.2,
+                        help='also compare tracking only the readings at least this confident')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    results = {
+        'benchmark': 'speed filters',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'readings': args.readings,
+        'min_confidence': args.min_confidence,
+        'glitch_rates': {},
+    }
+    for glitch_rate in GLITCH_RATES:
+        readings, vehicles = synthetic_readings(args.readings, 1, glitch_rate)
+        compared = {}
+        for spec in ['none'] + args.filters:
+            rated, seconds = filtered(readings, spec)
+            compared[spec] = {
+                'all_readings': tracked(rated, vehicles, 0.0),
+                'min_confidence': tracked(rated, vehicles, args.min_confidence),
+                'filter_us_per_reading': seconds / len(readings) * 1e6,
+            }
+        results['glitch_rates'][str(glitch_rate)] = {'vehicles': vehicles, 'filters': compared}
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: per-update latency of IPCamera overlay posts against a stub camera
+#
+# Compares the old way (a module level requests.post per update: new connection
+# plus digest challenge every time) with IPCamera's pooled session.
+#
+# python benchmarks/bench_ipcamera.py [updates] [simulated_rtt_secs]
+#####################################################
+import os
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import requests
+from requests.auth import HTTPDigestAuth
+import IPCamera
+from stub_camera import StubCamera
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(label, send, camera, updates):
+    before = camera.counters()
+    latencies = []
+    for i in range(updates):
+        start = time.perf_counter()
+        r = send(i)
+        latencies.append(time.perf_counter() - start)
+        assert r.status_code == 200, r.status_code
+    after = camera.counters()
+    counts = {key: after[key] - before[key] for key in after}
+    print(f"{label:>10}: p50 {percentile(latencies, 50)*1000:7.2f} ms  p99 {percentile(latencies, 99)*1000:7.2f} ms"
+          f"  mean {statistics.mean(latencies)*1000:7.2f} ms  http requests/update {counts['requests']/updates:.2f}"
+          f"  connections {counts['connections']}")
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.002
+    with StubCamera(delay=delay) as camera:
+        cam = IPCamera.IPCamera(overlay_url=camera.url)
+
+        def send_unpooled(i):
+            cam.update_overlay_payload_for_val(str(i))
+            return requests.post(cam.overlay_url,
+                auth = HTTPDigestAuth('user', 'password'),
+                headers = cam.headers,
+                json = cam.overlay_payload)
+
+        def send_pooled(i):
+            cam.update_overlay_payload_for_val(str(i))
+            return cam.send_overlay_payload()
+
+        run("unpooled", send_unpooled, camera, updates)
+        run("pooled", send_pooled, camera, updates)
+        cam.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: cost of the metrics (metrics.py) on the hot paths
+#
+# Reported, as JSON:
+#   operations -- ns per Counter.inc / Histogram.observe, and ms per scrape
+#   pipeline   -- bench_pipeline's throughput run with the metrics on, and with
+#                 inc/observe replaced by no-ops, alternating; the difference is the
+#                 overhead of the instrumentation
+#
+# python benchmarks/bench_metrics.py [--lines N] [--rounds R] [--output results.json]
+#####################################################
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import metrics
+from bench_pipeline import bench_throughput, make_lines
+
+
+def ns_per_call(statement, setup_globals, number=1000000):
+    timer = timeit.Timer(statement, globals=setup_globals)
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e9
+
+
+def bench_operations():
+    registry = metrics.Registry()
+    counter = registry.counter('bench_total', 'bench counter')
+    histogram = registry.histogram('bench_seconds', 'bench histogram', labels=('sensor',)).labels('a')
+    names = {'counter': counter.children[()], 'histogram': histogram}
+    result = {
+        'counter_inc_ns': ns_per_call('counter.inc()', names),
+        'histogram_observe_ns': ns_per_call('histogram.observe(0.0003)', names),
+        'perf_counter_pair_ns': ns_per_call('perf_counter() - perf_counter()', {'perf_counter': time.perf_counter}),
+    }
+    start = time.perf_counter()
+    text = metrics.REGISTRY.exposition()
+    result['scrape_ms'] = (time.perf_counter() - start) * 1000
+    result['scrape_bytes'] = len(text)
+    return result
+
+
+def disable_metrics():
+    """make inc/observe no-ops; returns a function that undoes it"""
+    saved = [(cls, name, getattr(cls, name))
+             for cls in (metrics.Counter, metrics.Histogram, metrics.Family)
+             for name in ('inc', 'observe') if hasattr(cls, name)]
+    for cls, name, _ in saved:
+        setattr(cls, name, lambda self, value=1: None)
+
+    def restore():
+        for cls, name, method in saved:
+            setattr(cls, name, method)
+    return restore
+
+
+def bench_pipeline(lines, rounds):
+    on, off = [], []
+    for _ in range(rounds):
+        on.append(bench_throughput(lines)['lines_per_sec'])
+        restore = disable_metrics()
+        try:
+            off.append(bench_throughput(lines)['lines_per_sec'])
+        finally:
+            restore()
+    on_rate, off_rate = statistics.median(on), statistics.median(off)
+    return {
+        'lines': len(lines),
+        'rounds': rounds,
+        'lines_per_sec_with_metrics': on_rate,
+        'lines_per_sec_without_metrics': off_rate,
+        'overhead_percent': (off_rate - on_rate) / off_rate * 100,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='metrics overhead benchmark')
+    parser.add_argument('--lines', type=int, default=200000, help='lines per pipeline run')
+    parser.add_argument('--rounds', type=int, default=5, help='pipeline runs with and without metrics')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    results = {
+        'benchmark': 'metrics overhead',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'pipeline': bench_pipeline(make_lines(args.lines), args.rounds),
+        'operations': bench_operations(),   # after the pipeline, so the scrape has real series in it
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
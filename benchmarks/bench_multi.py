@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: many sensors in one process, pinned to one CPU core
+#
+# Runs a sensor_group.SensorGroup of N generated sensors that produce lines in real
+# time (like the live sensor, the reader threads wait for each line), with stub
+# handlers, and reports the CPU used and whether any sensor's ring buffer overran.
+#
+# python benchmarks/bench_multi.py [--sensors 8] [--rate 20] [--seconds 10]
+#####################################################
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import event_dispatch
+import ops_radar
+import sensor_group
+import sensor_source
+
+
+class CountingHandlers:
+    def __init__(self):
+        self.calls = 0
+
+    def on_target_acquired(self, recent_speed, sensor_id=None):
+        self.calls += 1
+
+    def on_target_accelerating(self, recent_speed, sensor_id=None):
+        self.calls += 1
+
+    def on_target_lost(self, sensor_id=None):
+        self.calls += 1
+
+
+class LiveLikeSource(sensor_source.SyntheticSource):
+    """generated lines in real time, that claims to be live so its reader never blocks on a full ring"""
+    is_live = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='multi-sensor CPU benchmark')
+    parser.add_argument('--sensors', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=20.0, help='lines/sec per sensor')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {sorted(os.sched_getaffinity(0))[0]})
+
+    handlers = CountingHandlers()
+    dispatcher = event_dispatch.EventDispatcher(handlers)
+    lines = int(args.rate * args.seconds)
+    sensors = [sensor_group.Sensor(f'sensor{i}',
+                                   LiveLikeSource(seed=i, rate=args.rate, realtime=True, lines=lines),
+                                   ops_radar.make_tracker())
+               for i in range(args.sensors)]
+    group = sensor_group.SensorGroup(sensors, dispatcher)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        group.run()
+    except EOFError:
+        pass
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    group.stop()
+    dispatcher.close()
+
+    readings = sum(sensor.ingest_reader.readings for sensor in sensors)
+    print(json.dumps({
+        'benchmark': 'ops_radar multi-sensor',
+        'sensors': args.sensors,
+        'rate_per_sensor': args.rate,
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'cpu_percent_of_one_core': 100 * cpu / wall,
+        'cpu_us_per_reading': 1e6 * cpu / readings if readings else None,
+        'readings': readings,
+        'handler_calls': handlers.calls,
+        'overruns': sum(sensor.ingest_reader.overruns for sensor in sensors),
+        'threads': threading.active_count(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: camera HTTP traffic of the IP camera handlers on a busy road
+#
+# Synthetic busy traffic is tracked, and its events are dispatched at their own
+# pace (--speedup times realtime) to two versions of radar_actions_ipcamera, each
+# posting to a stub camera:
+#   every call  -- the old handlers: a post on every acquired/accelerating/lost event
+#   debounced   -- radar_actions_ipcamera as it is: IPCamera.update_overlay skips
+#                  unchanged overlays and posts at most every min_update_interval
+# Reported, as JSON: events, camera requests of each, and whether both ended
+# showing the same overlay.  min_update_interval is divided by --speedup, so the
+# result is the one realtime traffic would give.
+#
+# python benchmarks/bench_overlay.py [--seconds S] [--speedup X] [--output results.json]
+#####################################################
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import event_dispatch
+import IPCamera
+import radar_actions_ipcamera
+import sensor_source
+import tracker
+from stub_camera import StubCamera
+
+
+class EveryCallHandlers:
+    """radar_actions_ipcamera as it was: every event is posted"""
+
+    def __init__(self, cam):
+        self.cam = cam
+
+    def on_target_acquired(self, recent_speed):
+        tstamp = datetime.now().strftime("\n%d/%m/%Y\n%H:%M:%S")
+        self.cam.update_overlay_payload_for_val(str(abs(round(recent_speed)))+" km/h" + tstamp)
+        self.cam.send_overlay_payload()
+
+    on_target_accelerating = on_target_acquired
+
+    def on_target_lost(self):
+        self.cam.update_overlay_payload_for_val("")
+        self.cam.send_overlay_payload()
+
+
+def traffic_events(seconds, seed=1):
+    """handler Events of busy synthetic traffic"""
+    source = sensor_source.SyntheticSource(seed=seed, mean_gap=1.0, lines=int(seconds * 20))
+    readings = []
+    try:
+        while True:
+            readings.append((float(source.readline()), source.timestamp()))
+    except EOFError:
+        pass
+    events = tracker.Tracker().feed_many(readings)
+    return [event for event in events if event.name != tracker.TARGET_ENDED]
+
+
+def replay(events, handlers, speedup):
+    """dispatch events to handlers at their pace"""
+    dispatcher = event_dispatch.EventDispatcher(handlers)
+    first = events[0].timestamp
+    start = time.perf_counter()
+    for event in events:
+        delay = start + (event.timestamp - first) / speedup - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        dispatcher.dispatch(event.name, *event.args, stats=event.stats)
+    dispatcher.close(timeout=60)
+    return dispatcher.stats()
+
+
+def run(events, speedup, make_handlers, rtt, min_update_interval):
+    with StubCamera(delay=rtt) as camera:
+        cam = IPCamera.IPCamera(overlay_url=camera.url, min_update_interval=min_update_interval / speedup)
+        dispatch = replay(events, make_handlers(cam), speedup)
+        cam.close()
+        return {
+            'camera_requests': camera.counters()['requests'],
+            'handled': sum(dispatch['dispatched'].values()),
+            'final_text': cam.overlay_payload['params']['text'],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='camera traffic of the IP camera handlers on a busy road')
+    parser.add_argument('--seconds', type=float, default=300, help='seconds of traffic')
+    parser.add_argument('--speedup', type=float, default=10, help='replay this many times faster than realtime')
+    parser.add_argument('--rtt', type=float, default=0.002, help='simulated camera round trip, secs')
+    parser.add_argument('--min-update-interval', type=float, default=IPCamera.IPCamera.min_update_interval,
+                        help='IPCamera.min_update_interval (realtime secs)')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    events = traffic_events(args.seconds)
+
+    def debounced(cam):
+        radar_actions_ipcamera.cam = cam
+        return radar_actions_ipcamera
+
+    every_call = run(events, args.speedup, EveryCallHandlers, args.rtt, args.min_update_interval)
+    debounced = run(events, args.speedup, debounced, args.rtt, args.min_update_interval)
+    results = {
+        'benchmark': 'ip camera overlay traffic',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seconds_of_traffic': args.seconds,
+        'min_update_interval': args.min_update_interval,
+        'events': {name: sum(1 for e in events if e.name == name) for name in sorted({e.name for e in events})},
+        'every_call': every_call,
+        'debounced': debounced,
+        'reduction': every_call['camera_requests'] / max(1, debounced['camera_requests']),
+        # (the time shown differs: the old handlers showed the time of the event, now it is the target's first reading)
+        'same_final_speed': every_call['final_text'].split('\n')[0] == debounced['final_text'].split('\n')[0],
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: lines/sec of ops_radar.read_velocity() vs line_parser.LineReader
+#
+# Both read the same lines from an in-memory serial port that behaves like pyserial.
+# Then the same for the sensor's JSON output (OJ OT OM): LineReader against
+# decoding each line with json.loads (with the lines already split, so only parsing is compared).
+#
+# python benchmarks/bench_parser.py [lines]
+#####################################################
+import json
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import line_parser
+import ops_radar
+from mock_serial import MockSerial, speed_lines
+
+
+def bench_read_velocity(data):
+    ops_radar.serial_port = port = MockSerial(data)
+    speeds = 0
+    start = time.perf_counter()
+    while not port.exhausted():
+        if ops_radar.read_velocity() is not None:
+            speeds += 1
+    return time.perf_counter() - start, speeds
+
+
+def bench_line_reader(data):
+    reader = line_parser.LineReader(MockSerial(data))
+    port = reader.source
+    speeds = 0
+    start = time.perf_counter()
+    while not port.exhausted():
+        speeds += len(reader.read_batch())
+    return time.perf_counter() - start, speeds
+
+
+def bench_json_loads(data):
+    speeds = 0
+    start = time.perf_counter()
+    for line in data.split(b'\n'):
+        if line.startswith(b'{'):
+            record = json.loads(line)
+            if 'speed' in record:
+                float(record['speed'])
+                float(record['time'])
+                float(record['magnitude'])
+                speeds += 1
+    return time.perf_counter() - start, speeds
+
+
+def compare(count, data, baseline, benches):
+    results = {}
+    for label, bench in benches:
+        elapsed, speeds = bench(data)
+        results[label] = count / elapsed
+        print(f"{label:>14}: {count / elapsed:12,.0f} lines/sec  ({speeds} speeds)")
+    print(f"{'speedup':>14}: {results['LineReader'] / results[baseline]:.1f}x")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print("plain speeds")
+    compare(count, speed_lines(count), "read_velocity",
+            (("read_velocity", bench_read_velocity), ("LineReader", bench_line_reader)))
+    print("JSON records with time and magnitude")
+    compare(count, speed_lines(count, json_output=True), "json.loads",
+            (("json.loads", bench_json_loads), ("LineReader", bench_line_reader)))
+
+
+if __name__ == "__main__":
+    main()
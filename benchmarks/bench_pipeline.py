@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: end-to-end benchmark of ops_radar: parsing, tracking and event dispatch
+#
+# ops_radar.main_loop runs unmodified against a mock serial port, with stub
+# handlers (optionally posting to a stub IP camera).  Reported, as JSON:
+#   throughput  -- sustained lines/sec with all input already waiting at the port
+#   latency     -- p50/p99 time from a speed line arriving at the port to
+#                  on_target_acquired (and on_target_accelerating) being called,
+#                  with lines fed at --rate lines/sec
+#   memory      -- resident set size sampled over the latency run
+# Save the JSON (--output) from two releases and compare them to catch regressions.
+#
+# python benchmarks/bench_pipeline.py [--lines N] [--rate R] [--camera] [--output results.json]
+#####################################################
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import event_dispatch
+import ops_radar
+import sensor_group
+import sensor_source
+from mock_serial import FeedSerial
+from stub_camera import StubCamera
+
+SEQUENCE = 100000   # line numbers are encoded in the speed's decimals, modulo this
+
+
+def make_lines(count, seed=1):
+    """synthetic traffic; each line's number is encoded in its decimals
+
+    the decimals decrease line after line, so they never look like acceleration
+    """
+    traffic = sensor_source.SyntheticSource(seed=seed)
+    lines = []
+    for i in range(count):
+        speed = int(traffic.readline())
+        sign = '-' if speed < 0 else ''
+        lines.append(b'%s%d.%05d\r\n' % (sign.encode(), abs(speed), SEQUENCE - 1 - i % SEQUENCE))
+    return lines
+
+
+def line_number(speed):
+    """the line number (modulo SEQUENCE) encoded in a speed from make_lines()"""
+    speed = abs(speed)
+    return SEQUENCE - 1 - round((speed - int(speed)) * SEQUENCE)
+
+
+def rss_bytes():
+    """current resident set size"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:  # not linux: peak is the best there is
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StubHandlers:
+    """records when each handler is called; optionally updates a (stub) camera like radar_actions_ipcamera"""
+
+    def __init__(self, camera=None):
+        self.camera = camera
+        self.calls = []   # (handler name, perf_counter at call, speed)
+
+    def _called(self, name, recent_speed=None):
+        self.calls.append((name, time.perf_counter(), recent_speed))
+        if self.camera is not None:
+            self.camera.update_overlay_payload_for_val("" if recent_speed is None else str(abs(round(recent_speed))))
+            self.camera.send_overlay_payload()
+
+    def on_target_acquired(self, recent_speed):
+        self._called('on_target_acquired', recent_speed)
+
+    def on_target_accelerating(self, recent_speed):
+        self._called('on_target_accelerating', recent_speed)
+
+    def on_target_decelerating(self, recent_speed):
+        self._called('on_target_decelerating', recent_speed)
+
+    def on_target_lost(self):
+        self._called('on_target_lost')
+
+    def on_idle_notice_interval(self):
+        self._called('on_idle_notice_interval')
+
+
+def run_ops_radar(port, handlers):
+    """run ops_radar.main_loop on port until the port's data runs out"""
+    ops_radar.dispatcher = event_dispatch.EventDispatcher(handlers)
+    ops_radar.sensors = sensor_group.SensorGroup(
+        [sensor_group.Sensor('bench', port, ops_radar.make_tracker())], ops_radar.dispatcher)
+    try:
+        ops_radar.main_loop()
+    except EOFError:
+        pass
+    ops_radar.sensors.stop()
+    ops_radar.dispatcher.close(timeout=30)
+    return ops_radar.dispatcher.stats()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench_throughput(lines, camera=None):
+    port = FeedSerial()
+    port.feed(b''.join(lines), len(lines))
+    port.close_feed()
+    start = time.perf_counter()
+    stats = run_ops_radar(port, StubHandlers(camera))
+    elapsed = time.perf_counter() - start
+    return {'lines': len(lines), 'seconds': elapsed, 'lines_per_sec': len(lines) / elapsed, 'dispatch': stats}
+
+
+def bench_latency(lines, rate, camera=None):
+    port = FeedSerial()
+    handlers = StubHandlers(camera)
+    arrivals = [0.0] * len(lines)
+    memory = []
+
+    def feeder():
+        start = time.perf_counter()
+        for i, line in enumerate(lines):
+            due = start + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals[i] = time.perf_counter()
+            port.feed(line)
+            if i % 1000 == 0:
+                memory.append(rss_bytes())
+        port.close_feed()
+
+    feed_thread = threading.Thread(target=feeder, daemon=True)
+    feed_thread.start()
+    stats = run_ops_radar(port, handlers)
+    feed_thread.join()
+
+    result = {'lines': len(lines), 'rate': rate, 'dispatch': stats}
+    for name in ('on_target_acquired', 'on_target_accelerating'):
+        latencies = []
+        for called, at, speed in handlers.calls:
+            if called == name:
+                # the latest line with this number that arrived before the call
+                i = line_number(speed)
+                while i + SEQUENCE < len(lines) and arrivals[i + SEQUENCE] and arrivals[i + SEQUENCE] <= at:
+                    i += SEQUENCE
+                latencies.append(at - arrivals[i])
+        result[name] = {
+            'count': len(latencies),
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+        }
+    result['memory'] = {
+        'rss_start_bytes': memory[0] if memory else None,
+        'rss_end_bytes': memory[-1] if memory else None,
+        'rss_peak_bytes': max(memory) if memory else None,
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ops_radar ingest-to-handler benchmark')
+    parser.add_argument('--lines', type=int, default=200000, help='lines for the throughput run')
+    parser.add_argument('--latency-lines', type=int, default=20000, help='lines for the latency/memory run')
+    parser.add_argument('--rate', type=float, default=2000.0, help='lines/sec fed in the latency run')
+    parser.add_argument('--camera', action='store_true', help='handlers post to a stub IP camera')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    results = {
+        'benchmark': 'ops_radar pipeline',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'camera': args.camera,
+    }
+    camera_server = None
+    camera = None
+    if args.camera:
+        import IPCamera
+        camera_server = StubCamera().__enter__()
+        camera = IPCamera.IPCamera(overlay_url=camera_server.url)
+    try:
+        results['throughput'] = bench_throughput(make_lines(args.lines), camera)
+        results['latency'] = bench_latency(make_lines(args.latency_lines), args.rate, camera)
+    finally:
+        if camera_server is not None:
+            camera.close()
+            results['camera_requests'] = camera_server.counters()
+            camera_server.__exit__()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
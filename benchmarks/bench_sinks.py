@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: a dead camera vs the other handlers: one handler module, or a handler chain
+#
+# Events are dispatched at --rate per sec to a console-like handler (it only notes the
+# time) and to radar_actions_ipcamera posting to a stub camera that never answers in
+# time (--camera-delay), in two ways:
+#   one module  -- both in one handler module (what editing radar_actions gave), one dispatcher
+#   chain       -- each a sink of a handler_chain.HandlerChain, the camera with a timeout
+#                  and circuit breaker
+# Reported, as JSON: for the console handler, how many of the events reached it, and
+# the time from dispatch to its call (median, 99th percentile, max).
+#
+# python benchmarks/bench_sinks.py [--seconds S] [--rate N] [--output results.json]
+#####################################################
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import types
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import event_dispatch
+import handler_chain
+import radar_actions_ipcamera
+from stub_camera import StubCamera
+
+
+def console_module(latencies):
+    """a handler module that notes how long each event took to reach it"""
+    console = types.ModuleType('bench_console')
+
+    def on_target_acquired(recent_speed, stats=None):
+        latencies.append(time.perf_counter() - stats)
+    console.on_target_acquired = on_target_acquired
+    return console
+
+
+def combined_module(console, camera):
+    """the console and camera handlers in one module (the console first, so the camera failing doesn't skip it)"""
+    combined = types.ModuleType('bench_combined')
+
+    def on_target_acquired(recent_speed, stats=None):
+        console.on_target_acquired(recent_speed, stats=stats)
+        camera.on_target_acquired(recent_speed)
+    combined.on_target_acquired = on_target_acquired
+    return combined
+
+
+def run(dispatcher, seconds, rate):
+    """dispatch acquired events (their dispatch time passed as stats) for seconds; returns the number sent"""
+    count = int(seconds * rate)
+    start = time.perf_counter()
+    for index in range(count):
+        delay = start + index / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        dispatcher.dispatch('on_target_acquired', 30.0 + index % 40, stats=time.perf_counter())
+    return count
+
+
+def summary(latencies, sent):
+    return {
+        'events': sent,
+        'reached_console': len(latencies),
+        'latency_ms_median': statistics.median(latencies) * 1000 if latencies else None,
+        'latency_ms_p99': sorted(latencies)[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+        'latency_ms_max': max(latencies) * 1000 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='a dead camera vs the other handlers')
+    parser.add_argument('--seconds', type=float, default=10, help='secs of events')
+    parser.add_argument('--rate', type=float, default=20, help='events per sec')
+    parser.add_argument('--camera-delay', type=float, default=30, help='secs the stub camera takes to answer')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)   # (the failed calls are logged with tracebacks)
+
+    results = {
+        'benchmark': 'handler sinks with a dead camera',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seconds': args.seconds,
+        'rate': args.rate,
+    }
+    with StubCamera(delay=args.camera_delay) as camera:
+        camera_options = dict(overlay_url=camera.url, min_update_interval=0, read_timeout=2.0, retries=0)
+
+        latencies = []
+        radar_actions_ipcamera.configure(**camera_options)
+        dispatcher = event_dispatch.EventDispatcher(combined_module(console_module(latencies), radar_actions_ipcamera),
+                                                    coalesce=())
+        sent = run(dispatcher, args.seconds, args.rate)
+        dispatcher.close(timeout=0)
+        results['one_module'] = summary(list(latencies), sent)
+
+        latencies = []
+        sys.modules['bench_console'] = console_module(latencies)
+        chain = handler_chain.HandlerChain([
+            handler_chain.Sink('bench_console'),
+            handler_chain.Sink('radar_actions_ipcamera', name='camera', timeout=0.5, failures=3, cooldown=5,
+                               options=camera_options, separate=True),
+        ])
+        sent = run(chain, args.seconds, args.rate)
+        results['chain'] = summary(list(latencies), sent)
+        results['chain_camera_calls'] = chain.sinks[1].dispatcher.stats()
+        chain.close(timeout=0)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+    os._exit(0)   # (the camera calls still waiting on the stub would hold up the exit)
+
+
+if __name__ == "__main__":
+    main()
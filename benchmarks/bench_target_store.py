@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: write rate and query time of the target store (target_store.py)
+#
+# Months of synthetic targets are written through TargetStore, then queried with
+# TargetReader.  Reported, as JSON: targets/sec written, bytes per target, and
+# ms per query (and targets found) for typical questions.
+#
+# python benchmarks/bench_target_store.py [--days D] [--per-day N] [--output results.json]
+#####################################################
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import target_store
+import tracker
+
+START = 1704067200   # 2024-01-01 UTC
+
+
+def synthetic_targets(days, per_day, seed=1):
+    """(sensor id, TargetStats, ended) in time order, per_day targets a day"""
+    rng = random.Random(seed)
+    for day in range(days):
+        times = sorted(rng.uniform(0, 86400) for _ in range(per_day))
+        for at in times:
+            speed = max(5.0, rng.gauss(35, 10)) * rng.choice((1, -1))
+            stats = tracker.TargetStats(speed, START + day * 86400 + at)
+            for i in range(rng.randint(5, 40)):
+                stats.add(speed + rng.gauss(0, 2), stats.last_time + 0.05)
+            yield rng.choice(('/dev/ttyACM0', '/dev/ttyACM1')), stats, rng.choice(target_store.ENDINGS[:2])
+
+
+def timed_query(reader, **query):
+    start = time.perf_counter()
+    found = sum(1 for _ in reader.query(**query))
+    return {'ms': (time.perf_counter() - start) * 1000, 'found': found}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='target store benchmark')
+    parser.add_argument('--days', type=int, default=90, help='days of targets')
+    parser.add_argument('--per-day', type=int, default=5000, help='targets a day')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        targets = list(synthetic_targets(args.days, args.per_day))
+        store = target_store.TargetStore(directory, flush_interval=1.0)
+        start = time.perf_counter()
+        for sensor_id, stats, ended in targets:
+            store.add(sensor_id, stats, ended)
+        added = time.perf_counter() - start
+        store.close(timeout=600)
+        written = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        reader = target_store.TargetReader(directory)
+        last_day = START + (args.days - 1) * 86400
+        results = {
+            'benchmark': 'target store',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'targets': len(targets),
+            'days': args.days,
+            'add_us_per_target': added / len(targets) * 1e6,   # the cost to the tracking loop
+            'targets_per_sec_written': len(targets) / written,
+            'bytes_per_target': size / len(targets),
+            'queries': {
+                'over 70, all days': timed_query(reader, over=70),
+                'over 60, one month': timed_query(reader, since=last_day - 30 * 86400, until=last_day, over=60),
+                'all, one hour': timed_query(reader, since=last_day + 8 * 3600, until=last_day + 9 * 3600),
+                'one sensor, over 60, one week': timed_query(reader, since=last_day - 7 * 86400, until=last_day,
+                                                             over=60, sensor='/dev/ttyACM1'),
+                'all, all days': timed_query(reader),
+            },
+        }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
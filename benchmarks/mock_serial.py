@@ -0,0 +1,133 @@
+#####################################################
+#
+# Description: an in-memory stand-in for pyserial's Serial, for benchmarks
+#
+# Like pyserial it is an io.RawIOBase, so readline() is the generic one that
+# reads a byte at a time, and read(n)/in_waiting work on what is "buffered".
+# It also has the sensor_source extras (timestamp, is_live) so ops_radar can use it.
+#####################################################
+import io
+import time
+
+
+def speed_lines(count, with_replies=True, json_output=False):
+    """bytes of count sensor lines: speeds, with the odd blank line and JSON reply mixed in
+
+    json_output -- speeds as the sensor's JSON records with time and magnitude (OJ OT OM)
+    """
+    lines = []
+    for i in range(count):
+        if with_replies and i % 500 == 499:
+            lines.append(b'{"SamplingRate":10000}\r\n')
+        elif i % 100 == 99:
+            lines.append(b'\r\n')
+        elif json_output:
+            lines.append(b'{"time":"%.3f","unit":"mph","magnitude":"%d","speed":"%d"}\r\n'
+                         % (i / 20, 20 + i % 30, (i % 40) - 20))
+        else:
+            lines.append(b'%d\r\n' % ((i % 40) - 20))
+    return b''.join(lines)
+
+
+class MockSerial(io.RawIOBase):
+    """serves data (bytes) as if it had all arrived at the port already"""
+    is_live = False
+
+    def __init__(self, data=b''):
+        super().__init__()
+        self.data = memoryview(data)
+        self.position = 0
+        self.written = []
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self.data) - self.position)
+        b[:n] = self.data[self.position:self.position + n]
+        self.position += n
+        return n
+
+    @property
+    def in_waiting(self):
+        return len(self.data) - self.position
+
+    def exhausted(self):
+        return self.position >= len(self.data)
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def timestamp(self):
+        return time.time()
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+
+class FeedSerial:
+    """a port that a feeder thread writes lines into while the reader drains it
+
+    read() blocks (up to timeout) like pyserial.  Once the feeder calls close_feed()
+    and everything has been read, read() raises EOFError like a finished replay.
+    timestamp() is a simulated sensor clock: the index of the newest line read
+    divided by sensor_rate, so tracking timings do not depend on how fast lines are fed.
+    """
+    is_live = False
+
+    def __init__(self, sensor_rate=20.0, timeout=0.5):
+        import threading
+        self.sensor_rate = sensor_rate
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._buffer = bytearray()
+        self._fed_lines = 0
+        self._read_lines = 0
+        self._feed_closed = False
+        self.written = []
+
+    def feed(self, data, lines=1):
+        with self._cond:
+            self._buffer += data
+            self._fed_lines += lines
+            self._cond.notify()
+
+    def close_feed(self):
+        with self._cond:
+            self._feed_closed = True
+            self._cond.notify()
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def read(self, size=1):
+        with self._cond:
+            if not self._buffer:
+                if self._feed_closed:
+                    raise EOFError('end of feed')
+                self._cond.wait(self.timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._read_lines += data.count(b'\n')
+            return data
+
+    def timestamp(self):
+        return self._read_lines / self.sensor_rate
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        pass
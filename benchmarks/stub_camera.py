@@ -0,0 +1,79 @@
+#####################################################
+#
+# Description: a local stand-in for the IP camera's HTTP overlay endpoint
+#
+# It answers like an Axis camera would as far as the benchmarks care:
+# a POST without credentials gets a 401 digest challenge, a POST with a digest
+# Authorization header gets 200.  The digest itself is not checked.
+# Requests, challenges and TCP connections are counted.
+#####################################################
+import http.server
+import threading
+import time
+
+
+class StubCameraHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real camera
+    disable_nagle_algorithm = True  # otherwise delayed ACKs dominate every loopback round trip
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.server.delay:
+            time.sleep(self.server.delay)  # simulated network + camera time per round trip
+        with self.server.lock:
+            self.server.requests += 1
+        if not self.headers.get("Authorization", "").startswith("Digest "):
+            with self.server.lock:
+                self.server.challenges += 1
+            self.send_response(401)
+            self.send_header("WWW-Authenticate",
+                'Digest realm="stub", nonce="0123456789abcdef", qop="auth", algorithm=MD5')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b'{"apiVersion": "1.0", "context": "321", "method": "setText", "data": {}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # quiet
+
+
+class StubCamera(http.server.ThreadingHTTPServer):
+    """stub camera HTTP server running in a background thread
+
+    with StubCamera() as cam:
+        IPCamera.IPCamera(overlay_url=cam.url)...
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(("127.0.0.1", 0), StubCameraHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.challenges = 0
+        self.connections = 0
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/axis-cgi/dynamicoverlay.cgi"
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def counters(self):
+        with self.lock:
+            return {"requests": self.requests, "challenges": self.challenges, "connections": self.connections}
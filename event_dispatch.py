@@ -0,0 +1,183 @@
+#####################################################
+#
+# Description: non-blocking dispatch of radar events to a handler module
+#
+# The serial reader only ever enqueues events; a worker thread drains the queue
+# and calls the handlers (radar_actions.py or similar).  A slow handler, like an
+# HTTP post to an IP camera, then never stalls reading of the sensor.
+#####################################################
+import collections
+import inspect
+import logging
+import threading
+import time
+
+import metrics
+
+# the handler functions a handler module (e.g. radar_actions.py) may implement
+HANDLER_NAMES = (
+    'on_target_acquired',
+    'on_target_accelerating',
+    'on_target_decelerating',
+    'on_target_lost',
+    'on_idle_notice_interval',
+)
+
+# event types where only the latest value matters.  If one of these is queued and
+# not yet handled, a newer event of the same type replaces its arguments.
+# Acquired and lost are never merged, so every target is reported.
+DEFAULT_COALESCED = (
+    'on_target_accelerating',
+    'on_target_decelerating',
+    'on_idle_notice_interval',
+)
+
+
+def accepts_keyword(function, keyword):
+    """True if function can be called with keyword=..."""
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):  # builtins and such
+        return False
+    return keyword in parameters or any(p.kind == p.VAR_KEYWORD for p in parameters.values())
+
+
+# keywords passed to the handlers that take them (older handlers are called with the args alone)
+#   sensor_id -- which sensor the event came from
+#   stats     -- tracker.TargetStats of the target, as of the event
+HANDLER_KEYWORDS = ('sensor_id', 'stats')
+
+
+HANDLER_SECONDS = metrics.histogram('ops_radar_handler_seconds', 'time taken by each handler call',
+                                    labels=('dispatcher', 'handler'))
+
+
+class EventDispatcher:
+    """bounded event queue drained by a worker thread
+
+    dispatch() never blocks.  When the queue is full the oldest pending event of a
+    coalesced type is dropped (and counted); acquired and lost events are dropped,
+    oldest first, only if the queue holds nothing else.  Handlers are called one at a
+    time in arrival order.
+    Events from several sensors are told apart by sensor_id.  sensor_id and the target's
+    stats are passed to the handlers that take those keywords (see HANDLER_KEYWORDS).
+    """
+
+    def __init__(self, handlers, max_pending=64, coalesce=DEFAULT_COALESCED, name='radar-dispatch'):
+        self.handlers = handlers
+        self.max_pending = max_pending
+        self.coalesce = frozenset(coalesce)
+        # per event type counters
+        self.enqueued = collections.Counter()
+        self.coalesced = collections.Counter()
+        self.dropped = collections.Counter()
+        self.dispatched = collections.Counter()
+        self.failed = collections.Counter()
+        self.name = name
+        metrics.register_collector(self.collect_metrics)
+
+        self._pending = collections.deque()  # [name, args, sensor_id, stats] lists so coalescing can replace args
+        self._keywords = {}  # handler name -> the HANDLER_KEYWORDS it accepts
+        self._handler_seconds = {}  # handler name -> its metrics histogram
+        self._cond = threading.Condition()
+        self._closing = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def dispatch(self, name, *args, sensor_id=None, stats=None):
+        """queue a call of handlers.<name>(*args).  returns False if the event was rejected"""
+        with self._cond:
+            if self._closing:
+                self.dropped[name] += 1
+                return False
+            self.enqueued[name] += 1
+            # latest-wins: only merge with the newest pending event, so ordering between
+            # different event types (or sensors) is never changed
+            if self._pending and name in self.coalesce:
+                newest = self._pending[-1]
+                if newest[0] == name and newest[2] == sensor_id:
+                    newest[1] = args
+                    newest[3] = stats
+                    self.coalesced[name] += 1
+                    return True
+            if len(self._pending) >= self.max_pending:
+                # make room by dropping the oldest event that only reports a latest value;
+                # acquired and lost events go only when nothing else is queued
+                victim = next((index for index, event in enumerate(self._pending)
+                               if event[0] in self.coalesce), None)
+                if victim is None and name in self.coalesce:
+                    self.dropped[name] += 1   # the queue is all acquired/lost: this one goes instead
+                    return False
+                if victim is None:
+                    victim = 0
+                self.dropped[self._pending[victim][0]] += 1
+                del self._pending[victim]
+            self._pending.append([name, args, sensor_id, stats])
+            self._cond.notify()
+        return True
+
+    def pending(self):
+        """number of events waiting for the worker"""
+        return len(self._pending)
+
+    def close(self, timeout=5.0):
+        """stop accepting events, run the ones already queued, and stop the worker
+
+        returns True if the queue was flushed within timeout
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            logging.warning(f'event dispatch did not flush in {timeout}s, {self.pending()} events left')
+            return False
+        return True
+
+    def stats(self):
+        """counters as a plain dict, for logging"""
+        return {
+            'enqueued': dict(self.enqueued),
+            'coalesced': dict(self.coalesced),
+            'dropped': dict(self.dropped),
+            'dispatched': dict(self.dispatched),
+            'failed': dict(self.failed),
+        }
+
+    def collect_metrics(self):
+        """the counters, for metrics.Registry (read only when asked for)"""
+        return [(f'ops_radar_events_{key}_total', 'counter', f'events {key}, per event type',
+                 [({'dispatcher': self.name, 'event': name}, count) for name, count in counter.items()])
+                for key, counter in (('enqueued', self.enqueued), ('coalesced', self.coalesced),
+                                     ('dropped', self.dropped), ('dispatched', self.dispatched),
+                                     ('failed', self.failed))]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:  # closing, and everything has been handled
+                    return
+                name, args, sensor_id, stats = self._pending.popleft()
+            handler = getattr(self.handlers, name, None)
+            if handler is None:  # handler modules need not implement every event
+                continue
+            keywords = self._keywords.get(name)
+            if keywords is None:
+                keywords = self._keywords[name] = tuple(
+                    keyword for keyword in HANDLER_KEYWORDS if accepts_keyword(handler, keyword))
+                self._handler_seconds[name] = HANDLER_SECONDS.labels(self.name, name)
+            started = time.perf_counter()
+            try:
+                if keywords:
+                    values = {'sensor_id': sensor_id, 'stats': stats}
+                    handler(*args, **{keyword: values[keyword] for keyword in keywords})
+                else:
+                    handler(*args)
+                self.dispatched[name] += 1
+            except Exception:
+                # a broken handler must not kill the worker
+                self.failed[name] += 1
+                logging.exception(f'{self.name}: handler {name} failed')
+            self._handler_seconds[name].observe(time.perf_counter() - started)
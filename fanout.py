@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: publish the live readings and events to other local processes
+#
+# Only one process can own the sensor's serial port.  With a Publisher, ops_radar
+# streams every parsed reading and tracker event over a UNIX domain socket, and any
+# number of local processes (a dashboard, a recorder, alerting) can subscribe with
+# the Subscriber client below, each getting its own copy.
+#
+# The tracking loop only encodes each batch once and queues it, then wakes the sender
+# with flush() (nothing at all is done while there are no subscribers).  One sender
+# thread copies the batches to each subscriber's own buffer and writes them with
+# non-blocking sends, so a slow
+# subscriber only fills its own buffer; a subscriber more than max_pending bytes
+# behind is disconnected (it may reconnect), never the tracking loop slowed down.
+#
+# Framing: each frame is a FRAME header (kind, 0, sensor number, payload bytes), then
+#   FRAME_SENSOR    the sensor's name (utf-8), sent before its first frame and on connect
+#   FRAME_READINGS  READING records: time, velocity, magnitude (NaN if not reported)
+#   FRAME_EVENT     an EVENT record (time, EVENT_NAMES index, has stats, ENDINGS index or -1,
+#                   speed or NaN), then, if it has stats, a STATS record
+#
+#   python fanout.py /run/ops_radar.sock      # print what is published
+#####################################################
+import argparse
+import collections
+import logging
+import math
+import os
+import selectors
+import socket
+import stat
+import struct
+import threading
+
+import metrics
+import target_store
+import tracker
+
+FRAME = struct.Struct('<BBHI')
+FRAME_SENSOR, FRAME_READINGS, FRAME_EVENT = 1, 2, 3
+READING = struct.Struct('<ddf')
+EVENT = struct.Struct('<dBBbd')
+STATS = struct.Struct('<ddIdddb')   # first_time, last_time, count, peak, mean, _m2, direction
+EVENT_NAMES = ('on_target_acquired', 'on_target_accelerating', 'on_target_decelerating', 'on_target_lost',
+               'on_idle_notice_interval', tracker.TARGET_ENDED)
+NAN = float('nan')
+
+Readings = collections.namedtuple('Readings', 'sensor_id readings')      # [(timestamp, velocity, magnitude)]
+SensorEvent = collections.namedtuple('SensorEvent', 'sensor_id event')   # a tracker.Event
+
+
+def encode_readings(number, readings):
+    records = [READING.pack(timestamp, velocity, NAN if magnitude is None else magnitude)
+               for timestamp, velocity, magnitude in readings]
+    return FRAME.pack(FRAME_READINGS, 0, number, len(records) * READING.size) + b''.join(records)
+
+
+def encode_event(number, event):
+    name, args, timestamp, stats = event
+    reason = speed = None
+    if name == tracker.TARGET_ENDED:
+        reason = target_store.ENDINGS.index(args[0])
+    elif args:
+        speed = args[0]
+    payload = EVENT.pack(timestamp, EVENT_NAMES.index(name), stats is not None,
+                         -1 if reason is None else reason, NAN if speed is None else speed)
+    if stats is not None:
+        payload += STATS.pack(stats.first_time, stats.last_time, stats.count, stats.peak, stats.mean,
+                              stats._m2, stats.direction)
+    return FRAME.pack(FRAME_EVENT, 0, number, len(payload)) + payload
+
+
+def decode_event(payload):
+    timestamp, name, has_stats, reason, speed = EVENT.unpack_from(payload)
+    name = EVENT_NAMES[name]
+    if reason >= 0:
+        args = (target_store.ENDINGS[reason],)
+    elif not math.isnan(speed):
+        args = (speed,)
+    else:
+        args = ()
+    stats = None
+    if has_stats:
+        stats = tracker.TargetStats.__new__(tracker.TargetStats)
+        (stats.first_time, stats.last_time, stats.count, stats.peak, stats.mean,
+         stats._m2, stats.direction) = STATS.unpack_from(payload, EVENT.size)
+    return tracker.Event(name, args, timestamp, stats)
+
+
+def decode_readings(payload):
+    return [(timestamp, velocity, None if math.isnan(magnitude) else magnitude)
+            for timestamp, velocity, magnitude in READING.iter_unpack(payload)]
+
+
+class _Connection:
+    """one subscriber: its socket and what is still to be sent to it"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = bytearray()
+        self.writing = False   # registered for EVENT_WRITE
+
+
+class Publisher:
+    """serves the readings and events on a UNIX domain socket at path
+
+    max_pending -- bytes a subscriber may fall behind before it is disconnected
+    counters: frames, bytes_sent, subscribers (connected now), connected, dropped (too slow)
+    """
+
+    def __init__(self, path, max_pending=1 << 20):
+        self.path = path
+        self.max_pending = max_pending
+        self.frames = 0
+        self.bytes_sent = 0
+        self.connected = 0
+        self.dropped = 0
+        self.subscribers = 0   # read without the lock by the tracking loop: 0 means publish nothing
+        self._sensor_numbers = {}
+        self._sensor_frames = []   # FRAME_SENSOR of each sensor, for new subscribers
+        self._queue = []           # frames for the sender thread
+        self._lock = threading.Lock()
+        self._closed = False
+        self._connections = {}     # socket: _Connection
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f'{path} exists and is not a socket; not replacing it')
+            os.unlink(path)        # left by an earlier run
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        self._listener.listen(16)
+        self._listener.setblocking(False)
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, name='radar-fanout', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        metrics.register_collector(self.collect_metrics)
+        return self
+
+    def publish_readings(self, sensor_id, readings):
+        """(timestamp, velocity, magnitude) readings of a sensor, as taken from its IngestReader"""
+        if self.subscribers and readings:
+            self._put(encode_readings(self._number(sensor_id), readings))
+
+    def publish_event(self, sensor_id, event):
+        """a tracker.Event of a sensor"""
+        if self.subscribers:
+            self._put(encode_event(self._number(sensor_id), event))
+
+    def flush(self):
+        """send what was published.  called once per batch, since waking the sender thread
+        lets it take the GIL from the tracking loop
+        """
+        if self._queue:
+            self._wake()
+
+    def close(self):
+        self._closed = True
+        self._wake()
+        if self._thread.is_alive():
+            self._thread.join(2.0)
+        for sock in list(self._connections):
+            sock.close()
+        self._selector.close()
+        self._listener.close()
+        self._wake_reader.close()
+        self._wake_writer.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        return {'subscribers': self.subscribers, 'connected': self.connected, 'dropped': self.dropped,
+                'frames': self.frames, 'bytes_sent': self.bytes_sent}
+
+    def collect_metrics(self):
+        """the publisher's counters, for metrics.Registry"""
+        return [
+            ('ops_radar_fanout_subscribers', 'gauge', 'subscribers connected', [({}, self.subscribers)]),
+            ('ops_radar_fanout_frames_total', 'counter', 'frames published', [({}, self.frames)]),
+            ('ops_radar_fanout_sent_bytes_total', 'counter', 'bytes sent to subscribers', [({}, self.bytes_sent)]),
+            ('ops_radar_fanout_dropped_total', 'counter', 'subscribers disconnected for falling behind',
+             [({}, self.dropped)]),
+        ]
+
+    def _number(self, sensor_id):
+        number = self._sensor_numbers.get(sensor_id)
+        if number is None:
+            number = self._sensor_numbers[sensor_id] = len(self._sensor_numbers)
+            name = sensor_id.encode()
+            frame = FRAME.pack(FRAME_SENSOR, 0, number, len(name)) + name
+            with self._lock:
+                self._sensor_frames.append(frame)
+            self._put(frame)
+        return number
+
+    def _put(self, frame):
+        with self._lock:
+            self._queue.append(frame)
+            self.frames += 1
+
+    def _wake(self):
+        try:
+            self._wake_writer.send(b'\0')
+        except BlockingIOError:   # already plenty of wake ups waiting
+            pass
+
+    def _run(self):
+        while not self._closed:
+            for key, mask in self._selector.select():
+                sock = key.fileobj
+                if sock is self._listener:
+                    self._accept()
+                elif sock is self._wake_reader:
+                    self._take_queue()
+                else:
+                    connection = self._connections.get(sock)
+                    if connection is None:   # disconnected earlier in this round
+                        continue
+                    if mask & selectors.EVENT_READ and not self._readable(sock):
+                        continue
+                    if mask & selectors.EVENT_WRITE:
+                        self._send(connection)
+        # closing: what was published before close() still goes out, if the subscribers take it soon
+        self._take_queue()
+        for connection in self._connections.values():
+            try:
+                connection.sock.settimeout(1.0)
+                connection.sock.sendall(connection.pending)
+            except OSError:
+                pass
+
+    def _accept(self):
+        try:
+            sock, _ = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        connection = _Connection(sock)
+        with self._lock:
+            connection.pending += b''.join(self._sensor_frames)
+        self._connections[sock] = connection
+        self._selector.register(sock, selectors.EVENT_READ)
+        self.subscribers = len(self._connections)
+        self.connected += 1
+        logging.info(f'fanout: subscriber connected ({self.subscribers} now)')
+        self._send(connection)
+
+    def _take_queue(self):
+        try:
+            while self._wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            frames, self._queue = self._queue, []
+        if not frames:
+            return
+        data = b''.join(frames)
+        for connection in list(self._connections.values()):
+            connection.pending += data
+            if len(connection.pending) > self.max_pending:
+                self.dropped += 1
+                logging.warning(f'fanout: subscriber {len(connection.pending)} bytes behind, disconnected')
+                self._disconnect(connection.sock)
+            else:
+                self._send(connection)
+
+    def _readable(self, sock):
+        """subscribers send nothing; a read is the end of the connection (False then)"""
+        try:
+            if sock.recv(4096):
+                return True
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        self._disconnect(sock)
+        return False
+
+    def _send(self, connection):
+        try:
+            sent = connection.sock.send(connection.pending)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._disconnect(connection.sock)
+            return
+        self.bytes_sent += sent
+        del connection.pending[:sent]
+        writing = bool(connection.pending)
+        if writing != connection.writing:
+            connection.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self._selector.modify(connection.sock, events)
+
+    def _disconnect(self, sock):
+        self._selector.unregister(sock)
+        del self._connections[sock]
+        sock.close()
+        self.subscribers = len(self._connections)
+
+
+class Subscriber:
+    """client: reads what a Publisher publishes, as Readings and SensorEvent tuples
+
+    with fanout.Subscriber('/run/ops_radar.sock') as published:
+        for message in published:
+            ...
+    iteration ends when the publisher closes the connection (or disconnects a slow subscriber)
+    """
+
+    def __init__(self, path, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self._file = self.sock.makefile('rb')
+        self.sensors = {}   # number: name
+
+    def receive(self):
+        """the next Readings or SensorEvent; None once the publisher has closed the connection"""
+        while True:
+            header = self._file.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return None
+            kind, _, number, size = FRAME.unpack(header)
+            payload = self._file.read(size)
+            if len(payload) < size:
+                return None
+            if kind == FRAME_SENSOR:
+                self.sensors[number] = payload.decode()
+            elif kind == FRAME_READINGS:
+                return Readings(self.sensors.get(number), decode_readings(payload))
+            elif kind == FRAME_EVENT:
+                return SensorEvent(self.sensors.get(number), decode_event(payload))
+
+    def __iter__(self):
+        while True:
+            message = self.receive()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='print the readings and events ops_radar publishes (--fanout)')
+    parser.add_argument('path', help='the socket path given to ops_radar --fanout')
+    parser.add_argument('--events', action='store_true', help='only the events, not every reading')
+    args = parser.parse_args()
+    with Subscriber(args.path) as published:
+        for message in published:
+            if isinstance(message, SensorEvent):
+                event = message.event
+                print(f'{event.timestamp:.3f} {message.sensor_id} {event.name}{event.args} {event.stats or ""}')
+            elif not args.events:
+                for timestamp, velocity, magnitude in message.readings:
+                    print(f'{timestamp:.3f} {message.sensor_id} {velocity:g} {"" if magnitude is None else magnitude}')
+
+
+if __name__ == "__main__":
+    main()
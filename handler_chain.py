@@ -0,0 +1,289 @@
+#####################################################
+#
+# Description: several handler modules ("sinks"), declared in a YAML file, called in parallel
+#
+# Each sink is a handler module (like radar_actions.py), imported only when the
+# config names it, with its own EventDispatcher: every sink gets every event, in
+# order, on its own worker thread, so a slow sink never holds up the others.
+# A sink may also have
+#   timeout   -- secs a handler call may take.  A call still running then is left to
+#                finish on its own, counted as failed, and the sink goes on with the next event
+#   failures  -- consecutive failed (or timed out) calls that open its circuit breaker:
+#                the sink's events are then skipped, not called, for cooldown secs, after
+#                which one call is tried again
+#   options   -- passed to the module's configure(**options), if it has one, before any event
+# A sink module's close(), if it has one, is called at exit.
+#
+#   sinks:
+#     - module: radar_actions
+#     - module: radar_actions_ipcamera
+#       name: gate camera
+#       timeout: 2.0
+#       failures: 3
+#       cooldown: 30
+#       options:
+#         overlay_url: http://192.168.1.20/axis-cgi/dynamicoverlay.cgi
+#         username: user
+#         password: password
+#####################################################
+import functools
+import importlib
+import importlib.util
+import logging
+import threading
+import time
+
+import yaml
+
+import event_dispatch
+import metrics
+
+SINK_KEYS = ('module', 'name', 'timeout', 'failures', 'cooldown', 'max_pending', 'options')
+
+SINK_CALLS = metrics.counter('ops_radar_sink_calls_total', 'handler calls of each sink, by result '
+                             '(ok, failed, timeout, skipped while its circuit breaker was open)',
+                             labels=('sink', 'result'))
+
+
+class CircuitBreaker:
+    """opens after failures consecutive failures; after cooldown secs, lets one call try again"""
+
+    def __init__(self, failures=5, cooldown=30.0):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at = None   # None while closed
+        self._trying = False    # the one call allowed after the cooldown is running
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """True if a call may be made now"""
+        if self.opened_at is None:
+            return True
+        if self._trying or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        self._trying = True
+        return True
+
+    def succeeded(self):
+        self.consecutive = 0
+        self.opened_at = None
+        self._trying = False
+
+    def failed(self):
+        """returns True if this failure opened the breaker"""
+        self.consecutive += 1
+        self._trying = False
+        if self.opened_at is not None:   # the trial call failed too
+            self.opened_at = time.monotonic()
+            return False
+        if self.consecutive >= self.failures:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class SinkTimeout(TimeoutError):
+    """a handler call took longer than its sink's timeout"""
+
+
+class _CallRunner:
+    """runs calls on its own thread, so the caller can stop waiting after a timeout"""
+
+    def __init__(self, name):
+        self._call = None
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def call(self, function, args, kwargs, timeout):
+        """function(*args, **kwargs).  raises SinkTimeout if it is not done in timeout secs;
+        the runner can not be used again then (the call is still running on it)
+        """
+        done = threading.Event()
+        outcome = {}
+        with self._ready:
+            self._call = (function, args, kwargs, done, outcome)
+            self._ready.notify()
+        if not done.wait(timeout):
+            raise SinkTimeout(f'{function.__name__} took more than {timeout}s')
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+
+    def stop(self):
+        with self._ready:
+            self._call = False
+            self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while self._call is None:
+                    self._ready.wait()
+                call, self._call = self._call, None
+            if call is False:
+                return
+            function, args, kwargs, done, outcome = call
+            try:
+                outcome['result'] = function(*args, **kwargs)
+            except Exception as e:
+                outcome['error'] = e
+            done.set()
+
+
+class GuardedHandlers:
+    """a handler module, as seen by a sink's EventDispatcher: each call within the sink's
+    timeout and only while its circuit breaker is closed
+    """
+
+    def __init__(self, module, name, timeout=None, breaker=None):
+        self.module = module
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._runner = None
+        self._results = {result: SINK_CALLS.labels(name, result) for result in ('ok', 'failed', 'timeout', 'skipped')}
+        self._guarded = {}
+
+    def __getattr__(self, handler_name):
+        if handler_name.startswith('_'):
+            raise AttributeError(handler_name)
+        guarded = self._guarded.get(handler_name)
+        if guarded is None:
+            handler = getattr(self.module, handler_name)   # AttributeError: the module doesn't handle it
+            guarded = self._guarded[handler_name] = self._guard(handler)
+        return guarded
+
+    def _guard(self, handler):
+        @functools.wraps(handler)   # (so the dispatcher still sees which keywords it takes)
+        def guarded(*args, **kwargs):
+            breaker = self.breaker
+            if not breaker.allow():
+                self._results['skipped'].inc()
+                return None
+            try:
+                if self.timeout is None:
+                    result = handler(*args, **kwargs)
+                else:
+                    if self._runner is None:
+                        self._runner = _CallRunner(f'radar-sink {self.name}')
+                    result = self._runner.call(handler, args, kwargs, self.timeout)
+            except Exception as e:
+                if isinstance(e, SinkTimeout):
+                    self._runner.stop()   # it ends when the call does; the next call gets a new thread
+                    self._runner = None
+                    self._results['timeout'].inc()
+                else:
+                    self._results['failed'].inc()
+                if breaker.failed():
+                    logging.warning(f'sink {self.name}: {breaker.consecutive} failures in a row, '
+                                    f'its events are skipped for {breaker.cooldown}s')
+                raise
+            if breaker.is_open:
+                logging.info(f'sink {self.name}: working again')
+            breaker.succeeded()
+            self._results['ok'].inc()
+            return result
+        return guarded
+
+    def close(self):
+        if self._runner is not None:
+            self._runner.stop()
+
+
+class Sink:
+    """one handler module with its own dispatcher (see the top of this file for the settings)"""
+
+    def __init__(self, module, name=None, timeout=None, failures=5, cooldown=30.0, max_pending=64, options=None,
+                 separate=False):
+        self.name = name or module
+        self.module = import_separately(module) if separate else importlib.import_module(module)
+        configure = getattr(self.module, 'configure', None)
+        if configure is not None:
+            configure(**(options or {}))
+        elif options:
+            raise ValueError(f'sink {self.name}: {module} has no configure() to take its options')
+        self.handlers = GuardedHandlers(self.module, self.name, timeout, CircuitBreaker(failures, cooldown))
+        self.dispatcher = event_dispatch.EventDispatcher(self.handlers, max_pending=max_pending,
+                                                         name=f'sink {self.name}')
+
+    def close(self, timeout=5.0):
+        flushed = self.dispatcher.close(timeout)
+        self.handlers.close()
+        close = getattr(self.module, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                logging.exception(f'sink {self.name}: close failed')
+        return flushed
+
+
+class HandlerChain:
+    """the sinks, in the place of one EventDispatcher: every event is dispatched to each of them"""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def dispatch(self, name, *args, sensor_id=None, stats=None):
+        """queue the event for every sink.  returns False if any of them rejected it"""
+        accepted = True
+        for sink in self.sinks:
+            accepted = sink.dispatcher.dispatch(name, *args, sensor_id=sensor_id, stats=stats) and accepted
+        return accepted
+
+    def pending(self):
+        return sum(sink.dispatcher.pending() for sink in self.sinks)
+
+    def close(self, timeout=5.0):
+        """close the sinks (each flushing its queue), all at once so one slow sink doesn't
+        take the others' time
+        """
+        results = {}
+        threads = [threading.Thread(target=lambda sink=sink: results.update({sink.name: sink.close(timeout)}))
+                   for sink in self.sinks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return all(results.values())
+
+    def stats(self):
+        return {sink.name: sink.dispatcher.stats() for sink in self.sinks}
+
+
+def import_separately(module_name):
+    """a new copy of a module, with module level state (e.g. radar_actions_ipcamera.cam) of its own"""
+    spec = importlib.util.find_spec(module_name)
+    if spec is None:
+        raise ModuleNotFoundError(f'no module named {module_name!r}', name=module_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load(path):
+    """a HandlerChain of the sinks in the YAML file at path"""
+    with open(path) as config_file:
+        config = yaml.safe_load(config_file) or {}
+    sinks = config.get('sinks') if isinstance(config, dict) else None
+    if not sinks:
+        raise ValueError(f'{path}: no sinks')
+    chain = []
+    modules = set()
+    for index, settings in enumerate(sinks):
+        if isinstance(settings, str):   # just a module name
+            settings = {'module': settings}
+        unknown = set(settings) - set(SINK_KEYS)
+        if 'module' not in settings or unknown:
+            raise ValueError(f'{path}: sink {index + 1} needs a module, and may only have {", ".join(SINK_KEYS)}'
+                             + (f' (not {", ".join(sorted(unknown))})' if unknown else ''))
+        # a module used by two sinks (two cameras, say) is imported twice, so they share nothing
+        chain.append(Sink(**settings, separate=settings['module'] in modules))
+        modules.add(settings['module'])
+        logging.info(f'handler sink {chain[-1].name}: {settings["module"]}')
+    return HandlerChain(chain)
@@ -0,0 +1,128 @@
+#####################################################
+#
+# Description: continuous, lossless ingest of sensor readings
+#
+# A dedicated thread reads the sensor all the time and keeps the readings, with the
+# time each was taken, in a bounded ring buffer for the tracking loop to take.
+# Nothing is ever thrown away implicitly: if the tracking loop falls so far behind
+# that the ring fills up, the oldest readings are overwritten and counted as overruns.
+# (For a recording or generated data the reader waits for room instead, so a
+# faster-than-realtime replay loses nothing.)
+#####################################################
+import collections
+import logging
+import threading
+
+
+class IngestReader:
+    """reads speeds with a line_parser.LineReader on a background thread
+
+    counters:
+    readings      -- speeds put in the ring buffer
+    overruns      -- readings overwritten before the tracking loop took them
+    dropped_lines -- lines that could not be parsed (see also LineReader.blanks, .reply_count)
+    high_water    -- the most readings that were ever waiting in the ring buffer
+
+    data_ready -- optional threading.Event, set whenever readings arrive (or the reader stops),
+                  so one loop can wait on the readers of several sensors at once
+    """
+
+    def __init__(self, line_reader, capacity=4096, block_when_full=False, data_ready=None, name='radar-ingest'):
+        self.line_reader = line_reader
+        self.data_ready = data_ready
+        self.capacity = capacity
+        self.block_when_full = block_when_full
+        self.readings = 0
+        self.overruns = 0
+        self.high_water = 0
+        self._ring = collections.deque()   # (timestamp, velocity, magnitude), see line_parser
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._error = None    # what ended the reader thread (EOFError at the end of a replay)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    @property
+    def dropped_lines(self):
+        return self.line_reader.bad
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def get_readings(self, timeout=1.0):
+        """take all the waiting (timestamp, velocity, magnitude) readings, oldest first
+
+        waits up to timeout for at least one; returns an empty list if none came.
+        once the reader has stopped (e.g. end of a replay) and everything was taken,
+        the exception that stopped it is raised.
+        """
+        with self._cond:
+            if not self._ring:
+                if self._error is None and not self._stopping:
+                    self._cond.wait(timeout)
+                if not self._ring:
+                    if self._error is not None:
+                        raise self._error
+                    return []
+            readings = list(self._ring)
+            self._ring.clear()
+            self._cond.notify_all()   # room again, for a reader waiting in block_when_full mode
+        return readings
+
+    def stats(self):
+        """counters as a plain dict, for logging"""
+        return {
+            'lines': self.line_reader.lines,
+            'readings': self.readings,
+            'overruns': self.overruns,
+            'dropped_lines': self.dropped_lines,
+            'blank_lines': self.line_reader.blanks,
+            'replies': self.line_reader.reply_count,
+            'high_water': self.high_water,
+            'capacity': self.capacity,
+        }
+
+    def _run(self):
+        line_reader = self.line_reader
+        ring = self._ring
+        capacity = self.capacity
+        try:
+            while not self._stopping:
+                readings = line_reader.read_batch()
+                if not readings:
+                    continue
+                with self._cond:
+                    for reading in readings:
+                        if len(ring) >= capacity:
+                            if self.block_when_full:
+                                while len(ring) >= capacity and not self._stopping:
+                                    self._cond.wait()
+                                if self._stopping:
+                                    return
+                            else:
+                                ring.popleft()
+                                self.overruns += 1
+                                if self.overruns == 1:
+                                    logging.warning('ingest ring buffer overrun: tracking is not keeping up with the sensor')
+                        ring.append(reading)
+                    self.readings += len(readings)
+                    if len(ring) > self.high_water:
+                        self.high_water = len(ring)
+                    self._cond.notify_all()
+                if self.data_ready is not None:
+                    self.data_ready.set()
+        except Exception as e:   # EOFError at the end of a replay, or a serial port failure
+            if not isinstance(e, EOFError):
+                logging.exception('sensor reader stopped')
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+            if self.data_ready is not None:
+                self.data_ready.set()
@@ -0,0 +1,154 @@
+#####################################################
+#
+# Description: bulk, byte level parsing of the OPS24x line stream
+#
+# read_velocity() in ops_radar.py reads one line at a time and turns each into a
+# str before looking at it.  At high report rates that per-line overhead dominates
+# the CPU on small boards.  LineReader instead drains whatever bytes are waiting
+# in one read into a reusable buffer, splits and classifies complete lines as bytes,
+# and hands back the readings as a batch.
+#
+# Both output modes of the sensor are understood:
+#   plain speeds            12
+#   JSON records (OJ)       {"time":"12.345","unit":"mph","magnitude":"31","speed":"12"}
+# A JSON record that carries the sensor's time (OT) is timestamped with the sensor's
+# clock rather than with the time the host got around to reading it.
+#####################################################
+import collections
+import re
+import time
+
+import metrics
+
+BRACE = ord('{')   # lines starting with this are JSON: readings (with "speed") or replies to commands
+SPEED_KEY = b'"speed"'
+# the fields of a JSON reading.  values may be quoted, and may be lists (of which the first counts)
+JSON_FIELD = re.compile(rb'"(speed|time|magnitude)"\s*:\s*\[?\s*"?(-?[0-9]+(?:\.[0-9]*)?)')
+
+READ_SECONDS = metrics.histogram('ops_radar_serial_read_seconds',
+                                 'time taken by the reads of waiting data from the sensor (not the wait for it)',
+                                 labels=('sensor',))
+
+
+class LineReader:
+    """batch reader of readings from a sensor source (or anything serial-port-like)
+
+    a reading is a (timestamp, velocity, magnitude) tuple.  magnitude is None unless
+    the sensor reports it.  timestamp is the sensor's time if it reports it (mapped
+    onto the host's clock when first seen), otherwise the time the batch was read.
+
+    counters: lines, speeds, reply_count, blanks, bad (lines that were neither)
+    the most recent command replies are kept in .replies
+    name -- the sensor's name in the metrics (by default the source's)
+    """
+
+    def __init__(self, source, max_read=4096, name=None):
+        self.source = source
+        self.max_read = max_read
+        self.name = name or getattr(source, 'name', 'sensor')
+        self.read_seconds = READ_SECONDS.labels(self.name)
+        self.timestamp = None   # time the last batch was read
+        self.replies = collections.deque(maxlen=64)
+        self.lines = 0
+        self.speeds = 0
+        self.reply_count = 0
+        self.blanks = 0
+        self.bad = 0
+        self.sensor_clock_offset = None   # host time - sensor time
+        self._last_sensor_time = None
+        self._buffer = bytearray()   # a partial line carried over to the next read
+
+    def read_batch(self):
+        """read what is available and return the readings of all complete lines in it
+
+        blocks (up to the port timeout) only when nothing at all is waiting.
+        an empty list means no speed arrived.
+        """
+        source = self.source
+        waiting = source.in_waiting
+        if waiting:
+            started = time.perf_counter()
+            data = source.read(waiting if waiting < self.max_read else self.max_read)
+        else:
+            data = source.read(1)
+            started = time.perf_counter()   # waiting for the first byte is idle time, not read latency
+            if data:
+                # woke up on the first byte of a line; take the rest of what arrived with it
+                waiting = source.in_waiting
+                if waiting:
+                    data += source.read(waiting if waiting < self.max_read else self.max_read)
+        self.timestamp = source.timestamp()
+        if not data:
+            return []
+        self.read_seconds.observe(time.perf_counter() - started)
+        buffer = self._buffer
+        buffer += data
+        end = buffer.rfind(b'\n') + 1
+        if not end:
+            return []
+        lines = bytes(buffer[:end]).split(b'\n')
+        del buffer[:end]
+        lines.pop()   # the empty piece after the last newline
+        return self.parse_lines(lines, self.timestamp)
+
+    def parse_lines(self, lines, timestamp):
+        """classify lines (bytes, without newline) received at timestamp and return the readings found"""
+        readings = []
+        append = readings.append
+        for line in lines:
+            line = line.strip()   # also drops the \r
+            if not line:
+                self.blanks += 1
+            elif line[0] == BRACE:
+                if SPEED_KEY in line:
+                    reading = self.parse_json_reading(line, timestamp)
+                    if reading is None:
+                        self.bad += 1
+                    else:
+                        append(reading)
+                else:
+                    self.replies.append(line)
+                    self.reply_count += 1
+            else:
+                try:
+                    append((timestamp, float(line), None))   # float() takes bytes directly
+                except ValueError:  # well just toss this line out
+                    self.bad += 1
+        self.lines += len(lines)
+        self.speeds += len(readings)
+        return readings
+
+    def parse_json_reading(self, line, timestamp):
+        """(timestamp, velocity, magnitude) from a JSON reading, or None if it has no usable speed"""
+        velocity = sensor_time = magnitude = None
+        for key, value in JSON_FIELD.findall(line):   # no match objects, no dict, no str
+            if key == b'speed':
+                if velocity is None:
+                    velocity = float(value)
+            elif key == b'time':
+                sensor_time = float(value)
+            else:
+                if magnitude is None:
+                    magnitude = float(value)
+        if velocity is None:
+            return None
+        if sensor_time is not None:
+            timestamp = self.sensor_time_to_host(sensor_time, timestamp)
+        return (timestamp, velocity, magnitude)
+
+    def sensor_time_to_host(self, sensor_time, host_time):
+        """map the sensor's clock (secs since it powered up) onto the host's
+
+        the offset is fixed when the sensor's clock is first seen, so host scheduling
+        jitter never shows up in the timestamps.  it is set again if the sensor's
+        clock goes backwards (the sensor restarted).
+        """
+        if self.sensor_clock_offset is None or sensor_time < self._last_sensor_time:
+            self.sensor_clock_offset = host_time - sensor_time
+        self._last_sensor_time = sensor_time
+        return sensor_time + self.sensor_clock_offset
+
+    def flush(self):
+        """drop the partial line held over, and whatever is waiting at the port"""
+        del self._buffer[:]
+        self.source.flushInput()
@@ -0,0 +1,233 @@
+#####################################################
+#
+# Description: low overhead metrics, exposed Prometheus-style
+#
+# Counters and histograms are plain Python objects: inc() is an integer add and
+# observe() a bisect into a short list of bucket bounds, so they can stay on in
+# production.  Numbers the code already keeps (e.g. LineReader's line counts) are
+# not counted twice: a collector function reads them only when the metrics are
+# asked for.
+#
+# The metrics can be served on a local HTTP endpoint (start_http_server) in the
+# Prometheus text format, and/or logged periodically (start_periodic_dump).
+#
+# Counter updates are not locked.  Each metric is normally updated by one thread;
+# where several threads share one, an update may very rarely be lost.
+#####################################################
+import bisect
+import http.server
+import logging
+import threading
+import time
+import weakref
+
+# bucket bounds in secs, for latencies from a fraction of a millisecond to seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """a count that only goes up"""
+    type = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, label_text):
+        yield f'{name}{label_text} {self.value}'
+
+
+class Histogram:
+    """counts of observed values per bucket, plus their sum"""
+    type = 'histogram'
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, label_text):
+        base = label_text[1:-1] + ',' if label_text else ''
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{base}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{base}le="+Inf"}} {self.count}'
+        yield f'{name}_sum{label_text} {self.sum}'
+        yield f'{name}_count{label_text} {self.count}'
+
+
+class Family:
+    """a metric, possibly split by labels.  labels(...) returns the Counter/Histogram for those
+    label values; keep a reference to it on hot paths rather than calling labels() each time.
+    """
+
+    def __init__(self, name, help_text, kind, label_names=(), **options):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.options = options
+        self.children = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            self.children[()] = kind(**options)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, self.kind(**self.options))
+        return child
+
+    # unlabelled metrics can be used directly
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind.type}'
+        for values, child in list(self.children.items()):
+            yield from child.samples(self.name, _label_text(self.label_names, values))
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _family(self, name, help_text, kind, label_names, **options):
+        with self._lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = Family(name, help_text, kind, label_names, **options)
+            return family
+
+    def counter(self, name, help_text, labels=()):
+        return self._family(name, help_text, Counter, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._family(name, help_text, Histogram, labels, buckets=buckets)
+
+    def register_collector(self, collect):
+        """collect() returns [(name, type, help, [(labels dict, value), ...]), ...] when asked.
+
+        a bound method is held weakly, so registering doesn't keep its object alive
+        """
+        if hasattr(collect, '__self__'):
+            collect = weakref.WeakMethod(collect)
+        else:
+            collect = (lambda function: lambda: function)(collect)
+        with self._lock:
+            self.collectors.append(collect)
+
+    def exposition(self):
+        """all the metrics in the Prometheus text format"""
+        lines = []
+        for family in list(self.families.values()):
+            lines.extend(family.lines())
+        collected = {}   # collectors of the same metric (e.g. one per sensor) are merged
+        for collect_ref in list(self.collectors):
+            collect = collect_ref()
+            if collect is None:   # its object is gone
+                with self._lock:
+                    self.collectors.remove(collect_ref)
+                continue
+            try:
+                for name, kind, help_text, samples in collect():
+                    collected.setdefault(name, (kind, help_text, []))[2].extend(samples)
+            except Exception:
+                logging.exception('metrics collector failed')
+        for name, (kind, help_text, samples) in collected.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_label_text(labels.keys(), labels.values())} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """a compact one-line-per-metric view for logs: totals of counters, count/mean of histograms"""
+        out = []
+        for family in list(self.families.values()):
+            for values, child in list(family.children.items()):
+                name = family.name + _label_text(family.label_names, values)
+                if isinstance(child, Histogram):
+                    if child.count:
+                        out.append(f'{name} count={child.count} mean={child.sum / child.count * 1000:.3f}ms')
+                elif child.value:
+                    out.append(f'{name}={child.value}')
+        return out
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+register_collector = REGISTRY.register_collector
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.exposition().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line each
+
+
+def start_http_server(port, host='127.0.0.1', registry=REGISTRY):
+    """serve the metrics at http://host:port/metrics from a background thread"""
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logging.info(f'metrics at http://{host}:{server.server_address[1]}/metrics')
+    return server
+
+
+def start_periodic_dump(interval, registry=REGISTRY):
+    """log a summary of the metrics every interval secs, from a background thread
+
+    the summaries go to the 'ops_radar.stats' logger, at INFO, which this switches on
+    whatever the level of the root logger (ops_radar's is WARN)
+    """
+    stats_log = logging.getLogger('ops_radar.stats')
+    stats_log.setLevel(logging.INFO)
+
+    def dump():
+        while True:
+            time.sleep(interval)
+            stats_log.info('stats: ' + '; '.join(registry.summary()))
+    thread = threading.Thread(target=dump, name='metrics-dump', daemon=True)
+    thread.start()
+    return thread
@@ -2,10 +2,22 @@
 #####################################################
 # Import time, decimal, serial, reg expr, sys
 #
+import os
 import sys
 import time
+import argparse
+import signal
 import serial
-import radar_actions
+import importlib
+import event_dispatch
+import sensor_source
+import tracker
+import sensor_config
+import sensor_group
+import speed_filter
+import fanout
+import target_store
+import metrics
 import logging
 logging.basicConfig(stream=sys.stderr, level=logging.WARN)
 logging.debug('Welcome to ops_radar')
@@ -34,7 +46,7 @@ OPS24X_DECIMAL_DIGITS = 'F0'        # F-zero for no decimal reporting
 OPS24X_BLANKS_PREF = 'BZ'           # Blanks pref: send 0's not silence
 OPS24X_LIVE_SPEED = 'O1OS'          # OS cancels 9243 mode, enables no-delay speeds.  O1 only one speed
 OPS24X_MAX_REPORTABLE = 'R<200\n'   # Report only < than this speed
-OPS24X_MIN_REPORTABLE = f'R>{TARGET_MIN_SPEED_ALLOWED}\n'       # Report only > this speed
+OPS24X_MIN_REPORTABLE = f'R>{TARGET_MIN_SPEED_ALLOWED}\n'       # Report only > this speed (follows a runtime change of the min)
 OPS24X_BIDIRECTIONAL = "R|"
 OPS24X_INBOUND_ONLY  = "R+"
 OPS24X_OUTBOUND_ONLY = "R|"
@@ -46,35 +58,117 @@ TARGET_MAX_SPEED_ALLOWED = 150
 OPS24X_DIRECTION_PREF = OPS24X_INBOUND_ONLY
 # remove them when moving to actual vehicle testing.
 
-
-# global singleton resource
-serial_port = serial.Serial()  # we will initialize it in main_init()
-
-
-def send_ops24x_cmd(logging_prefix,ops24x_command):
+# the settings sent to the sensor at startup: (log description, command, query command)
+# the query command asks the module for the current value of that setting
+# (made from the constants above when needed, so a runtime config change of one is sent too)
+def ops24x_profile(json_output=False):
+    profile = [
+        ("Send Sampling Frequency: ", OPS24X_SAMPLING_FREQUENCY, 'S?'),
+        ("Send Transmit Power: ", OPS24X_TRANSMIT_POWER, 'P?'),
+        ("Send Magnitude Control: ", OPS24X_MAGNITUDE_MIN, 'M?'),
+        ("Send Decimal digits: ", OPS24X_DECIMAL_DIGITS, 'F?'),
+        ("Send line of Min Speed To Report:", OPS24X_MIN_REPORTABLE, 'R?'),
+        ("Send line of Max Speed To Report: ", OPS24X_MAX_REPORTABLE, 'R?'),
+        ("Send Units Preference: ", OPS24X_UNITS_PREF, 'U?'),
+        ("Send Zeros Preference: ", OPS24X_BLANKS_PREF, 'B?'),
+        ("Send Force Instantaneous speeds: ", OPS24X_LIVE_SPEED, 'O?'),
+        ("Send Directional Preference: ", OPS24X_DIRECTION_PREF, 'R?'),
+    ]
+    if json_output:
+        profile.append(("Send JSON output with time and magnitude: ", OPS24X_JSON_OUTPUT, 'O?'))
+    return profile
+# JSON output with the sensor's own timestamps and the magnitude of each reading.
+# Tracking then uses the sensor's clock, so it stays correct even if this host is too busy to read promptly.
+OPS24X_JSON_OUTPUT = 'OJOTOM'       # OJ JSON output, OT time report, OM magnitude report
+OPS24X_JSON_TIMESTAMPED = False     # or use the --json command line option
+OPS24X_CONFIG_TIMEOUT = 5.0     # secs allowed for configuring the sensor at startup
+# the last profile applied to each sensor, so a warm restart can skip configuring it
+OPS24X_PROFILE_CACHE = os.path.expanduser('~/.ops_radar_profile.json')
+
+# settings that can be changed while running, in a YAML file of NAME: value (runtime_config.py).
+# the file is read at startup, whenever it changes, and on SIGHUP.  the trackers take new thresholds
+# between readings (keeping any target in view), and only the sensor settings that changed are sent
+RUNTIME_CONFIG = None   # or use the --runtime-config command line option; None for none
+RUNTIME_SETTINGS = ('TARGET_MAX_SPEED_ALLOWED', 'TARGET_MIN_SPEED_ALLOWED', 'IDLE_NOTICE_INTERVAL',
+                    'TARGETLESS_MIN_INTERVAL_TIME', 'MIN_TRACK_TO_ACQUIRED_TIME',
+                    'OPS24X_UNITS_PREF', 'OPS24X_SAMPLING_FREQUENCY', 'OPS24X_TRANSMIT_POWER', 'OPS24X_MAGNITUDE_MIN',
+                    'OPS24X_DECIMAL_DIGITS', 'OPS24X_BLANKS_PREF', 'OPS24X_LIVE_SPEED', 'OPS24X_MAX_REPORTABLE',
+                    'OPS24X_MIN_REPORTABLE', 'OPS24X_DIRECTION_PREF')
+RUNTIME_DEFAULTS = {name: globals()[name] for name in RUNTIME_SETTINGS}   # what a setting removed from the file goes back to
+
+
+# serial port settings for a live sensor
+SERIAL_SETTINGS = dict(
+    baudrate=115200,
+    parity=serial.PARITY_NONE,
+    stopbits=serial.STOPBITS_ONE,
+    bytesize=serial.EIGHTBITS,
+    timeout=1,
+    writeTimeout=2
+)
+
+# global singleton resources
+# handlers are called from a worker thread so they never stall reading the sensors
+dispatcher = None  # we will initialize it in main_init()
+# all the sensors, each with its own reader thread and tracker (a sensor_group.SensorGroup)
+sensors = None  # we will initialize it in main_init()
+# the first sensor's source, which looks like a serial port (used by send_ops24x_cmd and read_velocity)
+serial_port = None  # we will initialize it in main_init()
+# the record of every target (a target_store.TargetStore), if TARGET_STORE_DIR is set
+target_records = None  # we will initialize it in main_init()
+# the sensors report JSON (set by main_init from --json or OPS24X_JSON_TIMESTAMPED)
+json_output = False
+# reads RUNTIME_CONFIG (a runtime_config.ConfigWatcher), if one is given
+runtime_watcher = None  # we will initialize it in main_init()
+# publishes the readings and events to other local processes (a fanout.Publisher), if FANOUT_SOCKET is set
+publisher = None  # we will initialize it in main_init()
+INGEST_BUFFER_READINGS = 4096   # readings held per sensor for the tracking loop (about 3 minutes at 20 readings/s)
+
+# noise filter applied to each sensor's speeds before tracking (speed_filter.py), e.g. "median:3",
+# "gate:20" or "gate:20,median:3"; None for none.  or use the --filter command line option
+SPEED_FILTER = None
+MIN_CONFIDENCE = 0.0        # filtered readings less confident than this (0..1) are not tracked
+
+# every target is recorded in this directory (target_store.py; query with python target_store.py DIR ...)
+TARGET_STORE_DIR = None     # or use the --target-store command line option; None to not record
+
+# the event handlers: the radar_actions module, or, if a file is named here, the handler sinks declared in it
+# (a YAML file, see handler_chain.py).  or use the --handlers command line option
+HANDLER_CONFIG = None
+
+# the readings and events are published on this UNIX socket for other processes (fanout.py;
+# e.g. python fanout.py /run/ops_radar.sock).  or use the --fanout command line option; None for none
+FANOUT_SOCKET = None
+
+# metrics (metrics.py), served for Prometheus at http://127.0.0.1:METRICS_PORT/metrics
+METRICS_PORT = None         # or use the --metrics-port command line option; None for no endpoint
+STATS_LOG_INTERVAL = 0      # secs between stats summaries in the log; 0 for none
+
+
+def send_ops24x_cmd(logging_prefix,ops24x_command,timeout=2.0):
     """
     send commands to the OPS24x module
 
     Note regarding debug print: console_msg_prefix is printed out prior to printing the command
-
+    Waits at most timeout secs for the module's reply; returns False if none came.
+    (main_init configures the module with sensor_config.configure, which is much faster
+    for a whole profile)
     """
     global serial_port
-    data_for_send_str = ops24x_command
-    data_for_send_bytes = str.encode(data_for_send_str)
+    data_for_send_bytes = ops24x_command.encode()
     logging.info(f"{logging_prefix}{ops24x_command}")
     serial_port.write(data_for_send_bytes)
     # Initialize message verify checking
-    ser_message_start = '{'
     ser_write_verify = False
+    deadline = time.monotonic() + timeout
     # Print out module response to command string
-    while not ser_write_verify:
+    while not ser_write_verify and time.monotonic() < deadline:
         data_rx_bytes = serial_port.readline()
-        data_rx_length = len(data_rx_bytes)
-        if data_rx_length != 0:
-            data_rx_str = str(data_rx_bytes)
-            if data_rx_str.find(ser_message_start):
-                logging.debug(data_rx_str)
-                ser_write_verify = True
+        if data_rx_bytes.strip():
+            logging.debug(data_rx_bytes)
+            ser_write_verify = True
+    if not ser_write_verify:
+        logging.warning(f"no reply from Ops24x Module to {ops24x_command!r}")
     return ser_write_verify
 
 
@@ -105,6 +199,7 @@ def read_velocity():
 
 def is_speed_in_allowed(velocity):
     """boolean function returns True if the argument is in acceptable range
+    (main_loop uses tracker.Tracker.is_speed_in_allowed, which has the same test)
 
     Parameter:
     velocity -- value to compare against the constants.  abs() is applied to this
@@ -116,225 +211,175 @@ def is_speed_in_allowed(velocity):
         return False
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='OmniPreSense OPS24x RADAR Sensor generic velocity processor')
+    parser.add_argument('ports', metavar='port', nargs='*', default=['/dev/ttyACM0'],
+                        help='serial port of each sensor (default /dev/ttyACM0, good for linux; e.g. COM3 on Windows), '
+                             'or replay:<capture file>, replay-fast:<capture file>, synthetic:[seed], synthetic-json:[seed]')
+    parser.add_argument('--capture', metavar='FILE',
+                        help='record every line read from the sensor to this capture file '
+                             '(with several sensors, FILE.0, FILE.1, ...)')
+    parser.add_argument('--json', action='store_true',
+                        help='have the sensor report JSON with its own timestamps and magnitudes, and track by its clock')
+    parser.add_argument('--reconfigure', action='store_true',
+                        help='send every setting to the sensor, even if it seems to have them already')
+    parser.add_argument('--handlers', metavar='FILE', default=HANDLER_CONFIG,
+                        help='call the handler sinks declared in this YAML file instead of radar_actions (handler_chain.py)')
+    parser.add_argument('--filter', metavar='SPEC', default=SPEED_FILTER,
+                        help='filter the speeds before tracking: median:N, gate:JUMP[:CONFIRM], '
+                             'alphabeta:ALPHA:BETA[:SCALE], or several joined by commas (see speed_filter.py)')
+    parser.add_argument('--min-confidence', type=float, metavar='C', default=MIN_CONFIDENCE,
+                        help='do not track filtered readings less confident than C (0..1)')
+    parser.add_argument('--target-store', metavar='DIR', default=TARGET_STORE_DIR,
+                        help='record every target (times, direction, peak and mean speed) in DIR')
+    parser.add_argument('--fanout', metavar='SOCKET', default=FANOUT_SOCKET,
+                        help='publish the readings and events to local subscribers on this UNIX socket (fanout.py)')
+    parser.add_argument('--runtime-config', metavar='FILE', default=RUNTIME_CONFIG,
+                        help='settings to change while running (YAML, NAME: value; see RUNTIME_SETTINGS), '
+                             'read again whenever the file changes or on SIGHUP')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', default=METRICS_PORT,
+                        help='serve metrics for Prometheus at http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--stats-interval', type=float, metavar='SECS', default=STATS_LOG_INTERVAL,
+                        help='log a summary of the metrics every SECS secs')
+    return parser.parse_args()
+
+
 def main_init():
     """
-    main program initialization: open the serial port, initialize the radar
+    main program initialization: open the serial ports, initialize the radars
     """
-    # Initialize the USB port to read from the OPS-24x module.  
-    # Baud rate will just lower the native USB speed.  
-    global serial_port
-    serial_port = serial.Serial(
-        baudrate=115200,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        bytesize=serial.EIGHTBITS,
-        timeout=1,
-        writeTimeout=2
-    )
-    if len(sys.argv) > 1:
-        serial_port.port = sys.argv[1]
+    global serial_port, dispatcher, sensors, target_records, publisher, json_output, runtime_watcher
+    args = parse_args()
+    if args.runtime_config:
+        import runtime_config   # (PyYAML is only needed for a runtime config)
+        runtime_watcher = runtime_config.ConfigWatcher(args.runtime_config, RUNTIME_SETTINGS, apply_runtime_settings)
+        runtime_watcher.check(force=True)   # before the settings are used
+    if args.metrics_port is not None:
+        metrics.start_http_server(args.metrics_port)
+    if args.stats_interval:
+        metrics.start_periodic_dump(args.stats_interval)
+    if args.handlers:
+        import handler_chain   # (PyYAML is only needed for a handler config)
+        dispatcher = handler_chain.load(args.handlers)
     else:
-        serial_port.port = "/dev/ttyACM0"  # good for linux
-    serial_port.open()
-    serial_port.flushInput()
-    serial_port.flushOutput()
-
-    # Initialize and query Ops24x Module
-    logging.info("Initializing Ops24x Module")
-    send_ops24x_cmd("Send Sampling Frequency: ", OPS24X_SAMPLING_FREQUENCY)
-    send_ops24x_cmd("Send Transmit Power: ", OPS24X_TRANSMIT_POWER)
-    send_ops24x_cmd("Send Magnitude Control: ", OPS24X_MAGNITUDE_MIN)
-    send_ops24x_cmd("Send Decimal digits: ", OPS24X_DECIMAL_DIGITS)
-    send_ops24x_cmd("Send line of Min Speed To Report:", OPS24X_MIN_REPORTABLE)
-    send_ops24x_cmd("Send line of Max Speed To Report: ", OPS24X_MAX_REPORTABLE)
-    send_ops24x_cmd("Send Units Preference: ", OPS24X_UNITS_PREF)
-    send_ops24x_cmd("Send Zeros Preference: ", OPS24X_BLANKS_PREF)
-    send_ops24x_cmd("Send Force Instantaneous speeds: ", OPS24X_LIVE_SPEED)
-    send_ops24x_cmd("Send Directional Preference: ", OPS24X_INBOUND_ONLY)
-    #send_ops24x_cmd("Ask Module Information: ", OPS24X_INFO_QUERY_COMMAND)
-
+        dispatcher = event_dispatch.EventDispatcher(importlib.import_module('radar_actions'))
+    json_output = args.json or OPS24X_JSON_TIMESTAMPED
+    profile = ops24x_profile(json_output)
+
+    all_sensors = []
+    for index, port in enumerate(args.ports):
+        capture_path = args.capture
+        if capture_path and len(args.ports) > 1:
+            capture_path = f'{capture_path}.{index}'
+        # Initialize the USB port to read from the OPS-24x module.  
+        # Baud rate will just lower the native USB speed.  
+        # (or open a recording, or a traffic generator, instead of the sensor)
+        source = sensor_source.open_source(port, capture_path=capture_path, **SERIAL_SETTINGS)
+        source.flushInput()
+        source.flushOutput()
+        sensor = sensor_group.Sensor(port, source, make_tracker(), ingest_capacity=INGEST_BUFFER_READINGS,
+                                     speed_filter=speed_filter.make_filter(args.filter),
+                                     min_confidence=args.min_confidence)
+        all_sensors.append(sensor)
+
+        if source.is_live:  # (a recording or generated data has no module to configure)
+            # Initialize and query Ops24x Module
+            # only the settings the module doesn't already have are sent
+            logging.info(f"Initializing Ops24x Module on {port}")
+            sensor_config.configure(sensor.line_reader, profile,
+                                    cache_path=None if args.reconfigure else OPS24X_PROFILE_CACHE,
+                                    timeout=OPS24X_CONFIG_TIMEOUT,
+                                    force=args.reconfigure, sensor_id=port)
+            #send_ops24x_cmd("Ask Module Information: ", OPS24X_INFO_QUERY_COMMAND)
+
+    serial_port = all_sensors[0].source
+    if args.target_store:
+        target_records = target_store.TargetStore(args.target_store)
+    if args.fanout:
+        publisher = fanout.Publisher(args.fanout).start()
+    sensors = sensor_group.SensorGroup(all_sensors, dispatcher, target_store=target_records, publisher=publisher)
+    if runtime_watcher is not None:
+        runtime_watcher.start()
+        if hasattr(signal, 'SIGHUP'):   # (not on Windows)
+            signal.signal(signal.SIGHUP, lambda signum, frame: runtime_watcher.reload())
+
+
+def tracker_settings():
+    """the Tracker thresholds at the top of this file"""
+    return dict(
+        min_speed=TARGET_MIN_SPEED_ALLOWED,
+        max_speed=TARGET_MAX_SPEED_ALLOWED,
+        idle_notice_interval=IDLE_NOTICE_INTERVAL,
+        targetless_min_interval=TARGETLESS_MIN_INTERVAL_TIME,
+        min_track_to_acquired=MIN_TRACK_TO_ACQUIRED_TIME)
+
+
+def make_tracker():
+    """a Tracker using the thresholds at the top of this file"""
+    return tracker.Tracker(**tracker_settings())
+
+
+def apply_runtime_settings(settings):
+    """make the settings of the runtime config (NAME: value) the current ones (called by runtime_watcher)
+
+    once running, the trackers get the new thresholds, and only the sensor commands that
+    changed are sent to each live sensor, on the open port, while it is being read
+    """
+    old_profile = ops24x_profile(json_output)
+    values = dict(RUNTIME_DEFAULTS, **settings)
+    for name, value in values.items():   # (checked before anything is changed)
+        if name.startswith('OPS24X_'):
+            values[name] = sensor_config.normalize_command(str(value))
+        elif not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError(f'{name} must be a number, not {value!r}')
+    if 'OPS24X_MIN_REPORTABLE' not in settings:   # the sensor stops reporting at the tracker's min speed
+        values['OPS24X_MIN_REPORTABLE'] = f'R>{values["TARGET_MIN_SPEED_ALLOWED"]}\n'
+    changed = {name: value for name, value in values.items() if globals()[name] != value}
+    globals().update(values)
+    if changed:
+        logging.info(f'runtime config: {changed}')
+    if sensors is None:   # (at startup, before anything uses them)
+        return
+    sensors.reconfigure_trackers(**tracker_settings())
+    to_send = sensor_config.profile_changes(old_profile, ops24x_profile(json_output))
+    if not to_send:
+        return
+    commands = ''.join(command for _, command, _ in to_send)
+    for sensor in sensors.sensors:
+        if sensor.source.is_live:
+            for description, command, _ in to_send:
+                logging.info(f"{sensor.sensor_id}: {description}{command}")
+            if not sensor_config.send_live(sensor.line_reader, commands, timeout=OPS24X_CONFIG_TIMEOUT):
+                logging.warning(f'{sensor.sensor_id}: not every changed setting was acknowledged')
 
 
 def main_loop():
     """
     main program loop:
-    there are two important states in this code, not-tracking and tracking.
+    take speeds read continuously from each sensor (ingest.py) and feed them to that
+    sensor's tracking state machine (tracker.py), through its noise filter (speed_filter.py) if one is set.
+    there are two important states in it, not-tracking and tracking.
     when not tracking, read data until there's an object worth tracking
     when tracking, analyze, and when appropriate, call an event handler.
+    Times are the times the readings were taken (by the sensor's clock in JSON mode,
+    otherwise when received; never when they are tracked), so a recording replayed
+    faster than realtime is tracked the same as it was live.
 
-    The event handlers have a baseline implementation in radar_actions.py and include
+    The event handlers have a baseline implementation in radar_actions.py (or are the sinks
+    in a handler config, handler_chain.py) and include
+    (they are queued to the dispatcher, never called directly from this loop)
     on_target_acquired(recent_speed)
     on_target_accelerating(recent_speed)
     on_target_decelerating(recent_speed)
     on_target_lost()
     on_idle_notice_interval()
+    A handler that takes a sensor_id keyword is told which sensor (port) the event is from.
+    A handler that takes a stats keyword gets the target's running numbers (tracker.TargetStats:
+    peak, mean, stdev, count, first_time, last_time), so it need not keep any speeds itself.
     """
-    global serial_port
-    recent_velocity = 0.0
-    prior_velocity = 0.0
-
-    # main loop to the program
-    while True:
-        # Flush serial buffers
-        serial_port.flushInput()
-        serial_port.flushOutput()
-        
-        # state machine variables
-        tracking = False
-        target_acquired = False
-
-        # Two principal states.  NotTracking and Tracking.
-        # NotTracking and Tracking are split into two loops and this goes between the two
-
-        # The first time we get a speed report in range, we will move to tracking
-        while not tracking:
-            # Reset tracking
-            target_acquired = False
-            # Wait for numeric speed
-            # Initialize wait timer
-            idle_start_time = time.time()
-            idle_current_time = idle_start_time
-            idle_delta_time = 0.0
-            is_valid_speed = False
-            # tight loop looking for objects
-            while not is_valid_speed:
-                # Get speed from OPS24x
-                velocity = read_velocity()
-                if velocity is not None:
-                    recent_velocity = velocity
-                    is_valid_speed = is_speed_in_allowed(recent_velocity)
-                    logging.debug(f'not tracking.  received speed:{abs(velocity)} ({is_valid_speed}) ')
-
-                    # only if IDLE_NOTICE_INTERVAL do we do idle notices
-                    if IDLE_NOTICE_INTERVAL>0 and not is_valid_speed:
-                        idle_current_time = time.time() # start the current timer over
-                        idle_delta_time = idle_current_time - idle_start_time
-                        if idle_delta_time > IDLE_NOTICE_INTERVAL:
-                            radar_actions.on_idle_notice_interval()
-                            logging.debug('notice: still idle')
-                            # Reset wait timer
-                            idle_start_time = idle_current_time
-                    # else:
-                    #     print("!")
-            # We left the 'while no activity' loop.  a Valid speed was received. move to tracking loop
-            # Begin tracking
-            tracking = True
-            logging.debug(f'NOW move to tracking.  received speed:{abs(velocity)}')
-
-
-        # Tracking has sub-conditions of acquiring ("just tracking") and target-acquired
-        # if there's an object that has stayed consistent for a length of time,
-        # it is called "target-acquired"
-        targetless_start_time = tracking_current_time = tracking_start_time = time.time()
-        while tracking:
-            # Initialize tracking timer
-            # logging.info('start tracking for acquire')
-            # Save old and new speeds
-            prior_velocity = recent_velocity
-            velocity = read_velocity()   
-            if velocity is None:
-                continue
-
-            recent_velocity = velocity
-            logging.debug(f'analyze received speed:{abs(recent_velocity)}')
-            tracking_current_time = time.time()
-
-            # states: not target_acquired and target_acquired
-            # transitions
-                # upon consistent reading (>MIN_TRACK_TO_ACQUIRED_TIME, no direction change),  not-acq to acq
-                # upon change of direction   if new speed is allowed, acq to not-acq. if out, tracking=false
-                # upon speed-out-of-range for more than an allowable time, tracking = false
-
-            if is_speed_in_allowed(recent_velocity):
-                # logging.debug('look for direction changes. confirm prior_velocity = ', prior_velocity, 'recent_velocity = ', recent_velocity)
-                # The instant the direction changes, old tracking ends
-
-                if (prior_velocity>0 and recent_velocity>0) or \
-                        (prior_velocity<0 and recent_velocity<0):
-                    # This should be the most common case when observing a target
-
-                    # Reset targetless wait timer
-                    targetless_start_time = None # we most definitely have a target
-
-                    # Check if tracking time is long enough to be valid
-                    if (tracking_current_time - tracking_start_time) > MIN_TRACK_TO_ACQUIRED_TIME:
-                        if not target_acquired:
-                            radar_actions.on_target_acquired(recent_velocity)
-                            # if we are to note the target acquisition as soon as possible, it goes here.
-                            if recent_velocity > 0:  # motion inbound
-                                logging.info(f"First acquire of inbound motion (speed {recent_velocity})")
-                            elif recent_velocity < 0: # motion outbound
-                                logging.info(f"First acquire of outbound motion (speed {recent_velocity})")
-
-                            target_acquired = True # will be changed only first time tracking_delta_time > MIN_TRACK_TO_ACQUIRED_TIME
-                            # now Continue tracking and getting speeds until direction change or wait timeout
-                        else:
-                            # target still acquired. that's great
-                            # hey, if there's a change in speed, do any desired actions
-                            if abs(recent_velocity) > abs(prior_velocity):
-                                logging.info(f"Acceleration detected (speed {recent_velocity})")
-                                radar_actions.on_target_accelerating(recent_velocity)
-                            # elif abs(recent_velocity) < abs(prior_velocity):
-                            #     logging.info(f"Deceleration detected (speed {recent_velocity})")
-                            #     radar_actions.on_target_decelerating(recent_velocity)
-
-                else: # not the same sign (thus not the same direction)
-                    # Direction changed!
-                    # So, this immediately stops tracking one target and starts tracking another
-                    # which has similar logic to going thru tracking/not-acquired and then acquired. 
-                    if target_acquired:  # well, it is not acquired now
-                        # possible cases:
-                        #   Tracking was valid and object is going past us.  Simple choice: declare new object.
-                        #   A new object is coming opposite direction.  Simple choice: immediately decree the old object is gone
-                        
-                        # So, now we have to enforce business policy.  
-                        target_acquired = False # future policy improvement: don't do this immediately?
-                        prior_velocity = 0
-
-                        if recent_velocity > 0: # motion changed to inbound
-                            logging.info('direction changed. motion now inbound')
-                        elif recent_velocity < 0:# motion outbound
-                            logging.info('direction changed. motion now outbound')
-                        else:
-                            # Getting zeros.  No object seen
-                            logging.info('Tracking no object')
-                    else:
-                        # Tracking time too short and wasn't not valid
-                        logging.info('Direction changed before tracking lock, restart tracking')
-
-                    # Reset valid tracking and continue to track new object                            
-                    targetless_start_time = time.time()  # it could be the start of targetless
-                    tracking_start_time = time.time()    # or even the start of tracking
-
-            else: # velocity is out of allowed range
-                logging.debug(f'speed {abs(velocity)} outside of allowed range')
-                targetless_current_time = time.time()
-                if targetless_start_time == None:
-                    targetless_start_time = time.time()
-                else:
-                    targetless_delta_time = targetless_current_time - targetless_start_time
-                    # declare giving up on target if time expired
-                    # todo?: may want to do that if direction changes now, too
-                    if targetless_delta_time > TARGETLESS_MIN_INTERVAL_TIME:
-                        if target_acquired:
-                            radar_actions.on_target_lost()
-                            # some target was acquired, but apparently object went out of range
-                            # because now we have out-of-range speed
-                            # OBSERVE: if target disappears (before direction switch), it will be counted here
-                            # WARN: but it could be a very long time between reporting events if the target
-                            # goes out of range (like walks behind) so this is not the ideal way to report.
-                            if recent_velocity > 0:
-                                # just captured motion was inbound.  could have changed though, it's a low reading
-                                logging.info('target lost.  seeing disallowed inbound')
-                            elif recent_velocity < 0:
-                                # just captured motion was outbound.  could have changed though, it's a low reading
-                                logging.info('target lost.  seeing disallowed outbound')
-                            else:
-                                logging.info('target lost.  seeing zeros')
-                        target_acquired = False
-                        tracking = False
-        # end if tracking
-    # end the not-tracking -> tracking loop.  do it again
+    global sensors
+    # runs until all the sensors have stopped
+    sensors.run()
 
 
 if __name__ == "__main__":
@@ -348,6 +393,20 @@ if __name__ == "__main__":
         main_loop()
     except KeyboardInterrupt:
         print("Keyboard interrupt received. Exiting.")
+    except EOFError as e:  # replayed or generated sources ran out of data
+        logging.info(f'{e}. Exiting.')
     finally:
-        # clean up
-        serial_port.close()
+        # clean up.  let the handlers see the events already queued
+        if runtime_watcher is not None:
+            runtime_watcher.stop()
+        if sensors is not None:
+            sensors.stop()
+        if target_records is not None:
+            target_records.close()
+        if publisher is not None:
+            publisher.close()
+        if dispatcher is not None:
+            dispatcher.close()
+            logging.info(f'event dispatch: {dispatcher.stats()}')
+        if sensors is not None:
+            sensors.close()
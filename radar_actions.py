@@ -1,22 +1,25 @@
 
 from datetime import datetime
 
-def on_target_acquired(recent_speed):
+# sensor_id is the port of the sensor the event came from (useful when running several sensors)
+# stats are the target's numbers so far (tracker.TargetStats): peak, mean, stdev, count, first_time, last_time, duration
+
+def on_target_acquired(recent_speed, sensor_id=None, stats=None):
     now = datetime.now()
-    print(f'on_target_acquired called at {now.strftime("%d/%m/%Y %H:%M:%S")}')
+    print(f'on_target_acquired called at {now.strftime("%d/%m/%Y %H:%M:%S")} ({sensor_id})')
 
-def on_target_accelerating(recent_speed):
+def on_target_accelerating(recent_speed, sensor_id=None, stats=None):
     now = datetime.now()
-    print(f'on_target_accelerating called at {now.strftime("%d/%m/%Y %H:%M:%S")}')
+    print(f'on_target_accelerating called at {now.strftime("%d/%m/%Y %H:%M:%S")} ({sensor_id})')
 
-def on_target_decelerating(recent_speed):
+def on_target_decelerating(recent_speed, sensor_id=None, stats=None):
     now = datetime.now()
-    print(f'on_target_decelerating called at {now.strftime("%d/%m/%Y %H:%M:%S")}')
+    print(f'on_target_decelerating called at {now.strftime("%d/%m/%Y %H:%M:%S")} ({sensor_id})')
 
-def on_target_lost():
+def on_target_lost(sensor_id=None, stats=None):
     now = datetime.now()
-    print(f'on_target_lost called at {now.strftime("%d/%m/%Y %H:%M:%S")}')
+    print(f'on_target_lost called at {now.strftime("%d/%m/%Y %H:%M:%S")} ({sensor_id}) {stats}')
 
-def on_idle_notice_interval():
+def on_idle_notice_interval(sensor_id=None):
     now = datetime.now()
-    print(f'on_target_lost called at {now.strftime("%d/%m/%Y %H:%M:%S")}')
+    print(f'on_target_lost called at {now.strftime("%d/%m/%Y %H:%M:%S")} ({sensor_id})')
@@ -5,26 +5,47 @@ from requests.auth import HTTPDigestAuth
 import IPCamera
 
 
-cam = IPCamera.IPCamera(overlay_url="http://127.0.0.1/test_url")
-
-def on_target_acquired(recent_speed):
-    now = datetime.now()
-    tstamp = now.strftime("\n%d/%m/%Y\n%H:%M:%S")
-    cam.update_overlay_payload_for_val(str(abs(round(recent_speed)))+" km/h" + tstamp)
-    cam.send_overlay_payload()
-
-def on_target_accelerating(recent_speed):
-    now = datetime.now()
-    tstamp = now.strftime("\n%d/%m/%Y\n%H:%M:%S")
-    cam.update_overlay_payload_for_val(str(abs(round(recent_speed)))+" km/h" + tstamp)
-    cam.send_overlay_payload()
+# the camera is made by configure(), with the options of this sink in the handler config
+# (handler_chain.py), or on the first event with DEFAULT_OVERLAY_URL if nothing configured it
+DEFAULT_OVERLAY_URL = "http://127.0.0.1/test_url"
+cam = None
+
+def configure(overlay_url=DEFAULT_OVERLAY_URL, username=None, password=None, **camera_options):
+    """point the handlers at a camera; camera_options are IPCamera settings (read_timeout, min_update_interval, ...)"""
+    global cam
+    if username is not None:
+        camera_options['auth'] = HTTPDigestAuth(username, password)
+    if cam is not None:
+        cam.close()
+    cam = IPCamera.IPCamera(overlay_url=overlay_url, **camera_options)
+
+def camera():
+    if cam is None:
+        configure()
+    return cam
+
+def close():
+    if cam is not None:
+        cam.close()
+
+# the overlay shows the speed and when the target was first seen (stats.first_time), so while
+# the rounded speed stays the same the overlay does too, and IPCamera.update_overlay posts nothing
+
+def overlay_text(recent_speed, stats):
+    when = datetime.fromtimestamp(stats.first_time) if stats is not None else datetime.now()
+    return str(abs(round(recent_speed)))+" km/h" + when.strftime("\n%d/%m/%Y\n%H:%M:%S")
+
+def on_target_acquired(recent_speed, stats=None):
+    camera().update_overlay(overlay_text(recent_speed, stats))
+
+def on_target_accelerating(recent_speed, stats=None):
+    camera().update_overlay(overlay_text(recent_speed, stats))
 
 def on_target_decelerating(recent_speed):
     pass
 
 def on_target_lost():
-    cam.update_overlay_payload_for_val("")
-    cam.send_overlay_payload()
+    camera().update_overlay("")
 
 def on_idle_notice_interval():
     # cam.update_payload_for_val("", cam.payload)
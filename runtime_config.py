@@ -0,0 +1,104 @@
+#####################################################
+#
+# Description: settings changed while running, from a YAML file
+#
+# The file holds settings by the names of ops_radar's constants, e.g.
+#   TARGET_MAX_SPEED_ALLOWED: 90
+#   IDLE_NOTICE_INTERVAL: 5.0
+#   OPS24X_MAGNITUDE_MIN: "M>30"
+# A ConfigWatcher reads it at startup and again whenever it changes (checked every
+# interval secs), or when reload() is called (ops_radar calls it on SIGHUP), and
+# passes the settings to a function that applies them.  A setting removed from the
+# file goes back to its value in the code.  A file that can't be read, has unknown
+# settings or a value the function rejects is logged and ignored; the settings stay
+# as they were.
+#####################################################
+import logging
+import os
+import threading
+
+import yaml
+
+
+def load(path, allowed):
+    """the settings in the YAML file at path.  raises ValueError for names not in allowed"""
+    with open(path) as config_file:
+        settings = yaml.safe_load(config_file) or {}
+    if not isinstance(settings, dict):
+        raise ValueError(f'{path}: expected settings as NAME: value')
+    unknown = set(settings) - set(allowed)
+    if unknown:
+        raise ValueError(f'{path}: not settings that can be changed: {", ".join(sorted(unknown))}')
+    return settings
+
+
+class ConfigWatcher:
+    """calls apply(settings) with the file's settings whenever it changes
+
+    allowed -- the setting names the file may have
+    apply   -- called (on the watcher's thread) with a dict of the settings in the file.
+               raises ValueError, before changing anything, for a value it can't take
+    """
+
+    def __init__(self, path, allowed, apply, interval=1.0):
+        self.path = path
+        self.allowed = allowed
+        self.apply = apply
+        self.interval = interval
+        self.reloads = 0
+        self.errors = 0
+        self._seen = None   # (mtime, size) of the file when last read
+        self._reload = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='radar-config', daemon=True)
+
+    def check(self, force=False):
+        """read and apply the file if it changed (or if force).  returns True if settings were applied"""
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if self._seen is not None or force:
+                logging.warning(f'runtime config: {e}')
+                self._seen = None
+            return False
+        seen = (stat.st_mtime_ns, stat.st_size)
+        if seen == self._seen and not force:
+            return False
+        self._seen = seen
+        try:
+            settings = load(self.path, self.allowed)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            self.errors += 1
+            logging.warning(f'runtime config not applied: {e}')
+            return False
+        try:
+            self.apply(settings)
+        except ValueError as e:
+            self.errors += 1
+            logging.warning(f'runtime config not applied: {e}')
+            return False
+        self.reloads += 1
+        return True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def reload(self):
+        """read the file again soon, changed or not.  safe to call from a signal handler"""
+        self._reload.set()
+
+    def stop(self):
+        self._stopping = True
+        self._reload.set()
+
+    def _run(self):
+        while not self._stopping:
+            force = self._reload.wait(self.interval)
+            self._reload.clear()
+            if self._stopping:
+                return
+            try:
+                self.check(force)
+            except Exception:   # a failure applying the settings must not end the watching
+                logging.exception('runtime config failed')
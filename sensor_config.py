@@ -0,0 +1,176 @@
+#####################################################
+#
+# Description: fast OPS24x configuration at startup (and changes while running)
+#
+# Sending the settings one by one, each waiting up to a second for its reply, costs
+# seconds of blind time after a power blip or USB re-enumeration.  Instead:
+#   - the module's current settings are read with the query commands, all in one write
+#   - only the settings that differ are sent, again all in one write
+#   - the whole thing has one overall deadline
+#   - the profile that was applied (and the query replies it produced) is cached on
+#     disk, so a warm restart of a module that still has it needs no configuration at all
+#
+# A profile is a list of (description, command, query) tuples, e.g.
+#   ("Send Sampling Frequency: ", "SX", "S?")
+# The query replies are not interpreted, only compared with the replies seen right
+# after the profile was last applied.  A setting whose query gets no reply is always sent.
+#
+# While the module is running, send_live() pushes just the changed settings
+# (profile_changes()) on the open port, and lets the reader thread count the replies.
+#####################################################
+import json
+import logging
+import os
+import re
+import time
+
+import metrics
+
+# the module answers every command with one JSON line.  Commands are two characters,
+# except that those with an operator (M>20, R<200, ...) carry a value up to a newline
+COMMAND_PATTERN = re.compile(r'\w[<>=][^\n]*\n?|..', re.DOTALL)
+REPLY_SETTLE_TIME = 0.5   # secs without a reply after which the module is assumed to be done
+
+SENSOR_COMMANDS = metrics.counter('ops_radar_sensor_commands_total',
+                                  'commands sent to the sensor, by whether it replied', labels=('replied',))
+SENSOR_EXCHANGE_SECONDS = metrics.histogram('ops_radar_sensor_exchange_seconds',
+                                            'time from writing commands to the sensor to the last reply')
+
+
+def split_commands(commands):
+    """'SXPXM>20\n' -> ['SX', 'PX', 'M>20\n']"""
+    return COMMAND_PATTERN.findall(commands)
+
+
+def exchange(reader, commands, deadline):
+    """write commands (str) in one go and collect their JSON replies, until deadline
+
+    reader -- a line_parser.LineReader on the sensor; speeds read meanwhile are discarded
+    returns the reply lines (bytes) received, in order.  stops early if the module
+    goes quiet for REPLY_SETTLE_TIME with replies still missing.
+    """
+    expected = len(split_commands(commands))
+    start = received = reader.reply_count
+    reader.source.write(commands.encode())
+    last_reply_time = started = time.monotonic()
+    while received - start < expected:
+        now = time.monotonic()
+        if now > deadline or now - last_reply_time > REPLY_SETTLE_TIME:
+            break
+        reader.read_batch()
+        if reader.reply_count != received:
+            received = reader.reply_count
+            last_reply_time = now
+    received = reader.reply_count - start
+    SENSOR_COMMANDS.labels('yes').inc(min(received, expected))
+    SENSOR_COMMANDS.labels('no').inc(max(expected - received, 0))
+    SENSOR_EXCHANGE_SECONDS.observe(last_reply_time - started)
+    if not received:
+        return []
+    return list(reader.replies)[-received:][:expected]
+
+
+def normalize_command(command):
+    """a command with an operator ends with a newline ('M>20' -> 'M>20\n'), so it can be sent with others"""
+    if re.match(r'\w[<>=]', command) and not command.endswith('\n'):
+        return command + '\n'
+    return command
+
+
+def profile_changes(old_profile, new_profile):
+    """the settings of new_profile whose command is not the one in old_profile (the same settings, in order)"""
+    return [new for old, new in zip(old_profile, new_profile) if old[1] != new[1]]
+
+
+def send_live(reader, commands, timeout=2.0):
+    """send commands to a module while it is being read (by an ingest.IngestReader).
+    the port is neither reopened nor read here: the reader's own thread counts the replies.
+    returns True if every command was answered within timeout
+    """
+    expected = len(split_commands(commands))
+    start = reader.reply_count
+    started = time.monotonic()
+    reader.source.write(commands.encode())
+    while reader.reply_count - start < expected and time.monotonic() - started < timeout:
+        time.sleep(0.01)
+    received = min(reader.reply_count - start, expected)
+    SENSOR_COMMANDS.labels('yes').inc(received)
+    SENSOR_COMMANDS.labels('no').inc(expected - received)
+    SENSOR_EXCHANGE_SECONDS.observe(time.monotonic() - started)
+    return received == expected
+
+
+def query_settings(reader, queries, deadline):
+    """ask the module for its current settings.  returns {query: reply} or None if not all replied"""
+    replies = exchange(reader, ''.join(queries), deadline)
+    if len(replies) != len(queries):
+        return None
+    return dict(zip(queries, (reply.decode('ascii', 'replace') for reply in replies)))
+
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache_path, cache):
+    # write then rename, so a power cut can't leave half a file
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w') as cache_file:
+        json.dump(cache, cache_file, indent=1)
+    os.replace(temp_path, cache_path)
+
+
+def configure(reader, profile, cache_path=None, timeout=5.0, force=False, sensor_id=None):
+    """bring the module to profile as quickly as possible
+
+    reader -- a line_parser.LineReader on the sensor
+    cache_path -- where the last applied profile is kept (None: no cache)
+    timeout -- overall deadline in secs
+    force -- send every setting, whatever the module or the cache says
+    sensor_id -- the sensor's entry in the cache (default: the name of its port)
+    returns True if the module is known to be configured
+    """
+    deadline = time.monotonic() + timeout
+    sensor = sensor_id or getattr(reader.source, 'name', 'sensor')
+    cache = load_cache(cache_path) if cache_path else {}
+    cached = cache.get(sensor)
+    commands = [command for _, command, _ in profile]
+    queries = list(dict.fromkeys(query for _, _, query in profile))
+
+    state = query_settings(reader, queries, deadline)
+    if not force and cached and state and cached['profile'] == commands and cached['state'] == state:
+        logging.info('Ops24x Module already has this profile, skipping configuration')
+        return True
+
+    if force or not cached or not state:
+        to_send = profile
+    else:
+        # settings that are new, or that the module no longer reports the way it did
+        cached_commands = set(cached['profile'])
+        cached_state = cached['state']
+        to_send = [setting for setting in profile
+                   if setting[1] not in cached_commands or state.get(setting[2]) != cached_state.get(setting[2])]
+    for description, command, _ in to_send:
+        logging.info(f"{description}{command}")
+    commands_to_send = ''.join(command for _, command, _ in to_send)
+    replies = exchange(reader, commands_to_send, deadline)
+    for reply in replies:
+        logging.debug(reply)
+    expected = len(split_commands(commands_to_send))
+    if len(replies) < expected:
+        logging.warning(f'Ops24x Module answered {len(replies)} of {expected} commands')
+        return False
+
+    if cache_path:
+        state = query_settings(reader, queries, deadline)
+        if state:
+            cache[sensor] = {'profile': commands, 'state': state}
+            try:
+                save_cache(cache_path, cache)
+            except OSError as e:
+                logging.warning(f'could not save the sensor profile cache: {e}')
+    return True
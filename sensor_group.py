@@ -0,0 +1,181 @@
+#####################################################
+#
+# Description: run any number of OPS24x sensors from one process
+#
+# Each Sensor has its own source, reader thread (ingest.py) and Tracker, so the
+# sensors are tracked independently.  One loop waits for readings from any of them,
+# feeds each sensor's readings (through its speed filter, if it has one; speed_filter.py)
+# to its own tracker, and sends the events, tagged
+# with the sensor's id, to the shared handlers through one dispatcher.
+# The record of each target that ends goes to an optional target_store.TargetStore, and
+# the readings and events to the subscribers of an optional fanout.Publisher.
+# The reader threads spend nearly all their time blocked in the serial read, so
+# many sensors fit on one core.
+#####################################################
+import logging
+import threading
+
+import ingest
+import line_parser
+import metrics
+import tracker
+
+
+class Sensor:
+    """one sensor: where its lines come from and the state tracking it
+
+    sensor_id -- name given to the handlers (by default the port, e.g. /dev/ttyACM0)
+    source    -- a sensor_source
+    tracker   -- a tracker.Tracker for this sensor alone
+    speed_filter   -- a speed_filter filter for this sensor alone, applied before the tracker; None for none
+    min_confidence -- filtered readings less confident than this are not tracked at all
+    """
+
+    def __init__(self, sensor_id, source, tracker, ingest_capacity=4096, speed_filter=None, min_confidence=0.0):
+        self.sensor_id = sensor_id
+        self.source = source
+        self.tracker = tracker
+        self.speed_filter = speed_filter
+        self.min_confidence = min_confidence
+        self.unconfident = 0   # readings not tracked for want of confidence
+        self.ingest_capacity = ingest_capacity
+        self.line_reader = line_parser.LineReader(source, name=sensor_id)
+        self.ingest_reader = None   # started by start()
+
+    def start(self, data_ready=None):
+        """start reading continuously.  a recording is read no faster than it is tracked"""
+        self.ingest_reader = ingest.IngestReader(self.line_reader, capacity=self.ingest_capacity,
+                                                 block_when_full=not self.source.is_live,
+                                                 data_ready=data_ready,
+                                                 name=f'radar-ingest {self.sensor_id}')
+        self.ingest_reader.start()
+
+    def stop(self):
+        if self.ingest_reader is not None:
+            self.ingest_reader.stop()
+            logging.info(f'ingest {self.sensor_id}: {self.ingest_reader.stats()}')
+
+    def close(self):
+        self.source.close()
+
+    def collect_metrics(self):
+        """the sensor's counters, for metrics.Registry (read only when asked for)"""
+        line_reader = self.line_reader
+        ingest_reader = self.ingest_reader
+        labels = {'sensor': self.sensor_id}
+        collected = [
+            ('ops_radar_lines_total', 'counter', 'lines read from the sensor', [(labels, line_reader.lines)]),
+            ('ops_radar_speeds_total', 'counter', 'speed readings parsed', [(labels, line_reader.speeds)]),
+            ('ops_radar_parse_failures_total', 'counter', 'lines that were neither a speed nor a reply',
+             [(labels, line_reader.bad)]),
+            ('ops_radar_blank_lines_total', 'counter', 'blank lines read', [(labels, line_reader.blanks)]),
+            ('ops_radar_replies_total', 'counter', 'command replies read', [(labels, line_reader.reply_count)]),
+            ('ops_radar_state_seconds_total', 'counter', 'time the tracker spent in each state',
+             [(dict(labels, state=state), seconds) for state, seconds in self.tracker.time_in_states().items()]),
+        ]
+        if self.speed_filter is not None:
+            collected.append(('ops_radar_unconfident_readings_total', 'counter',
+                              'filtered readings not tracked for their low confidence', [(labels, self.unconfident)]))
+        if ingest_reader is not None:
+            collected += [
+                ('ops_radar_ingest_overruns_total', 'counter', 'readings overwritten before they were tracked',
+                 [(labels, ingest_reader.overruns)]),
+                ('ops_radar_ingest_high_water', 'gauge', 'the most readings ever waiting to be tracked',
+                 [(labels, ingest_reader.high_water)]),
+            ]
+        return collected
+
+
+class SensorGroup:
+    """tracks all the sensors and dispatches their events"""
+
+    def __init__(self, sensors, dispatcher, target_store=None, publisher=None):
+        self.sensors = list(sensors)
+        self.dispatcher = dispatcher
+        self.target_store = target_store
+        self.publisher = publisher
+        self.data_ready = threading.Event()
+        self._tracker_settings = None   # new thresholds for every tracker, taken by the tracking loop
+        self._settings_lock = threading.Lock()
+        for sensor in self.sensors:
+            metrics.register_collector(sensor.collect_metrics)
+
+    def run(self):
+        """track until every sensor has stopped (end of a replay, or a port failure)
+
+        raises EOFError if the sensors ran out of data, otherwise what stopped the last sensor
+        """
+        for sensor in self.sensors:
+            sensor.start(self.data_ready)
+        dispatch = self.dispatcher.dispatch
+        publisher = self.publisher
+        active = list(self.sensors)
+        error = None
+        while active:
+            self.data_ready.wait(1.0)
+            self.data_ready.clear()
+            if self._tracker_settings is not None:
+                self._apply_tracker_settings()
+            for sensor in list(active):
+                try:
+                    readings = sensor.ingest_reader.get_readings(timeout=0)
+                except Exception as e:   # this sensor's reader has stopped; keep the others going
+                    logging.info(f'sensor {sensor.sensor_id} stopped: {e!r}')
+                    active.remove(sensor)
+                    error = e
+                    continue
+                feed = sensor.tracker.feed
+                sensor_id = sensor.sensor_id
+                speed_filter = sensor.speed_filter
+                if publisher is not None:
+                    publisher.publish_readings(sensor_id, readings)
+                for timestamp, velocity, magnitude in readings:
+                    if speed_filter is not None:
+                        velocity, confidence = speed_filter.update(velocity, timestamp)
+                        if confidence < sensor.min_confidence:
+                            sensor.unconfident += 1
+                            continue
+                    for event in feed(velocity, timestamp):
+                        if publisher is not None:
+                            publisher.publish_event(sensor_id, event)
+                        if event.name == tracker.TARGET_ENDED:
+                            self.record(sensor_id, event)
+                        else:
+                            dispatch(event.name, *event.args, sensor_id=sensor_id, stats=event.stats)
+                if publisher is not None:
+                    publisher.flush()
+        raise error or EOFError("no sensors to read")
+
+    def reconfigure_trackers(self, **settings):
+        """change every tracker's thresholds (see tracker.SETTINGS), from any thread.
+        the tracking loop makes the change between two batches of readings, to all the
+        settings at once, so no reading is tracked with some old settings and some new
+        """
+        with self._settings_lock:
+            self._tracker_settings = settings
+        self.data_ready.set()
+
+    def _apply_tracker_settings(self):
+        with self._settings_lock:
+            settings, self._tracker_settings = self._tracker_settings, None
+        for sensor in self.sensors:
+            sensor.tracker.reconfigure(**settings)
+        logging.info(f'tracker settings: {settings}')
+
+    def record(self, sensor_id, event):
+        if self.target_store is not None:
+            self.target_store.add(sensor_id, event.stats, *event.args)
+
+    def stop(self):
+        for sensor in self.sensors:
+            sensor.stop()
+            for event in sensor.tracker.finish():   # the targets still in view are recorded too
+                if self.publisher is not None:
+                    self.publisher.publish_event(sensor.sensor_id, event)
+                self.record(sensor.sensor_id, event)
+        if self.publisher is not None:
+            self.publisher.flush()
+
+    def close(self):
+        for sensor in self.sensors:
+            sensor.close()
@@ -0,0 +1,281 @@
+#####################################################
+#
+# Description: where OPS24x lines come from
+#
+# ops_radar.py reads the sensor through a "source" that looks like a serial port
+# (readline, read, in_waiting, write, flushInput, flushOutput, close) and also
+# reports the time each line was received.  Backends:
+#   SerialSource     - the live sensor
+#   ReplaySource     - a recorded capture file, with the original timing or as fast as possible
+#   SyntheticSource  - generated traffic, for trying things out without a sensor
+#   CaptureSource    - wraps another source and records every line it reads to a capture file
+#
+# Capture file format: one line per sensor line, "<unix time> <line as received>",
+# e.g. "1700000000.123456 23"
+#####################################################
+import math
+import random
+import time
+
+import serial
+
+
+class SensorSource:
+    """base class: serial-port-like access to a stream of OPS24x lines
+
+    subclasses implement _next_line(), returning one line (bytes, newline included)
+    or b'' when nothing arrived, and set self._timestamp for each line
+    """
+    is_live = False   # True only if commands written to this source reach a sensor
+
+    def __init__(self):
+        self._timestamp = time.time()
+        self._buffer = b''   # unread bytes of the current line, for read()
+
+    def readline(self):
+        if self._buffer:
+            line, self._buffer = self._buffer, b''
+            return line
+        return self._next_line()
+
+    def read(self, size=1):
+        if not self._buffer:
+            self._buffer = self._next_line()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    @property
+    def in_waiting(self):
+        if not self._buffer:
+            self._buffer = self._next_line()
+        return len(self._buffer)
+
+    def timestamp(self):
+        """time (secs) at which the most recently returned line was received"""
+        return self._timestamp
+
+    def write(self, data):
+        # nothing is listening; pretend it was sent
+        return len(data)
+
+    def flushInput(self):
+        pass   # never throw away recorded or generated data
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _next_line(self):
+        raise NotImplementedError
+
+
+class SerialSource(SensorSource):
+    """the live OPS24x on a serial (USB or UART) port"""
+    is_live = True
+
+    def __init__(self, port, **serial_settings):
+        super().__init__()
+        self.name = port
+        self.serial = serial.Serial(**serial_settings)
+        self.serial.port = port
+        self.serial.open()
+
+    def readline(self):
+        line = self.serial.readline()
+        self._timestamp = time.time()
+        return line
+
+    def read(self, size=1):
+        data = self.serial.read(size)
+        self._timestamp = time.time()
+        return data
+
+    @property
+    def in_waiting(self):
+        return self.serial.in_waiting
+
+    def write(self, data):
+        return self.serial.write(data)
+
+    def flushInput(self):
+        self.serial.flushInput()
+
+    def flushOutput(self):
+        self.serial.flushOutput()
+
+    def close(self):
+        self.serial.close()
+
+
+class ReplaySource(SensorSource):
+    """replay a capture file
+
+    speed -- 1.0 keeps the original inter-line timing, 10.0 is ten times faster,
+             None (or 0) replays as fast as the reader can take the lines
+    Timestamps are the recorded ones, so tracking timings are the same at any speed.
+    read() and in_waiting work one recorded line at a time, so each line keeps its own timestamp.
+    Raises EOFError when the recording is exhausted.
+    """
+
+    def __init__(self, path, speed=1.0):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self._file = open(path, 'rb')
+        self._first_time = None    # recorded time of the first line
+        self._start_time = None    # wall time at which the first line was replayed
+
+    def _next_line(self):
+        record = self._file.readline()
+        while record and not record.strip():
+            record = self._file.readline()
+        if not record:
+            raise EOFError(f'end of capture {self.path}')
+        recorded_time, _, line = record.rstrip(b'\r\n').partition(b' ')
+        self._timestamp = float(recorded_time)
+        if self.speed:
+            if self._first_time is None:
+                self._first_time = self._timestamp
+                self._start_time = time.time()
+            due = self._start_time + (self._timestamp - self._first_time) / self.speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        return line + b'\n'
+
+    def close(self):
+        self._file.close()
+
+
+class SyntheticSource(SensorSource):
+    """generated traffic: vehicles passing in either direction, with zeros in between
+
+    rate         -- readings per second (the sensor reports roughly 20/s with the default settings)
+    realtime     -- if True, lines are paced at rate; otherwise produced as fast as possible
+    noise        -- standard deviation of the speed noise
+    glitch_rate  -- probability of a single spurious reading (random speed, random sign)
+    lines        -- stop (EOFError) after this many lines; None for endless
+    json_output  -- lines as the sensor's JSON records with its time and magnitude (OJ OT OM)
+    """
+
+    def __init__(self, seed=None, rate=20.0, realtime=False, noise=1.0, glitch_rate=0.01,
+                 min_speed=15.0, max_speed=60.0, mean_gap=3.0, lines=None, json_output=False):
+        super().__init__()
+        self.json_output = json_output
+        self.random = random.Random(seed)
+        self.rate = rate
+        self.realtime = realtime
+        self.noise = noise
+        self.glitch_rate = glitch_rate
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.mean_gap = mean_gap
+        self.lines = lines
+        self.line_count = 0
+        self.vehicle_count = 0
+        self._start_time = self._timestamp
+        self._readings = self._generate()
+
+    def _generate(self):
+        """endless series of (unrounded) velocities, one per reading"""
+        r = self.random
+        while True:
+            # gap between vehicles
+            for _ in range(int(r.expovariate(1.0 / self.mean_gap) * self.rate)):
+                yield 0.0
+            # one vehicle: speed ramps up as it enters the beam and down as it leaves
+            self.vehicle_count += 1
+            speed = r.uniform(self.min_speed, self.max_speed)
+            direction = 1 if r.random() < 0.5 else -1
+            readings = int(r.uniform(1.5, 5.0) * self.rate)
+            for i in range(readings):
+                envelope = math.sin(math.pi * (i + 0.5) / readings) ** 0.25
+                yield direction * (speed * envelope + r.gauss(0.0, self.noise))
+
+    def _next_line(self):
+        if self.lines is not None and self.line_count >= self.lines:
+            raise EOFError('end of synthetic traffic')
+        self.line_count += 1
+        velocity = next(self._readings)
+        if self.glitch_rate and self.random.random() < self.glitch_rate:
+            velocity = self.random.choice((-1, 1)) * self.random.uniform(self.min_speed, self.max_speed)
+        self._timestamp = self._start_time + self.line_count / self.rate
+        if self.realtime:
+            delay = self._timestamp - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        if self.json_output:
+            # the sensor's clock counts from its power up
+            magnitude = 20 + abs(velocity) if velocity else 0
+            return b'{"time":"%.3f","unit":"mph","magnitude":"%d","speed":"%d"}\n' % (
+                self.line_count / self.rate, magnitude, round(velocity))
+        return b'%d\n' % round(velocity)
+
+
+class CaptureSource(SensorSource):
+    """pass-through to another source that records every line read to a capture file"""
+
+    def __init__(self, source, path):
+        super().__init__()
+        self.source = source
+        self.is_live = source.is_live
+        self.name = getattr(source, 'name', path)   # (the sensor's profile is cached by its port name)
+        self.path = path
+        self._file = open(path, 'ab')
+
+    def _record(self, line):
+        if line.strip():
+            self._file.write(b'%.6f %s\n' % (self.source.timestamp(), line.rstrip(b'\r\n')))
+        return line
+
+    def readline(self):
+        if self._buffer:
+            line, self._buffer = self._buffer, b''
+            return line
+        return self._record(self.source.readline())
+
+    def _next_line(self):
+        return self._record(self.source.readline())
+
+    def timestamp(self):
+        return self.source.timestamp()
+
+    def write(self, data):
+        return self.source.write(data)
+
+    def flushInput(self):
+        self.source.flushInput()
+
+    def flushOutput(self):
+        self.source.flushOutput()
+
+    def close(self):
+        self._file.close()
+        self.source.close()
+
+
+def open_source(spec, capture_path=None, **serial_settings):
+    """open a source given on the command line
+
+    spec -- a serial port name (/dev/ttyACM0, COM3, ...),
+            replay:<capture file>       replay with the original timing,
+            replay-fast:<capture file>  replay as fast as possible,
+            synthetic: or synthetic:<seed>  generated traffic in real time
+            synthetic-json: or synthetic-json:<seed>  the same, as timestamped JSON records
+    capture_path -- if given, everything read is also recorded to this file
+    serial_settings -- passed to serial.Serial for a serial port
+    """
+    kind, _, arg = spec.partition(':')
+    if kind == 'replay':
+        source = ReplaySource(arg, speed=1.0)
+    elif kind == 'replay-fast':
+        source = ReplaySource(arg, speed=None)
+    elif kind in ('synthetic', 'synthetic-json'):
+        source = SyntheticSource(seed=int(arg) if arg else None, realtime=True, json_output=kind == 'synthetic-json')
+    else:
+        source = SerialSource(spec, **serial_settings)
+    if capture_path:
+        source = CaptureSource(source, capture_path)
+    return source
@@ -0,0 +1,153 @@
+#####################################################
+#
+# Description: streaming noise filters for the speeds, applied before tracking
+#
+# A single spurious reading (a glitch of the other sign, or a jump in speed) makes
+# the tracker see a direction change, dropping and re-acquiring the target, or an
+# acceleration, and each of those can mean an HTTP call to a camera.  A filter
+# between the readings and the tracker removes them.  Every filter takes one
+# (velocity, timestamp) at a time, in constant time and memory, and returns the
+# filtered velocity with a confidence from 0 (a guess) to 1 (agrees with the readings).
+#
+#   median:N              median of the last N readings (N odd; 3 or 5 remove single glitches)
+#   gate:JUMP[:CONFIRM]   a reading more than JUMP from the last accepted one is held back
+#                         until CONFIRM readings in a row agree with it (default 2)
+#   alphabeta:A:B[:SCALE[:STEP]]  alpha-beta tracker of speed and its rate of change; SCALE is
+#                         the residual that halves the confidence (default 5), and the speed
+#                         is rounded to a multiple of STEP (default 1, as the sensor reports it).
+#                         it starts afresh at each target (after a zero, or a change of direction),
+#                         and passes glitches in a gap on, so put a gate in front of it
+# Filters can be chained with commas, e.g. "gate:20,median:3" (see make_filter).
+#####################################################
+import bisect
+import collections
+
+
+class MedianFilter:
+    """median of the last size readings.  confidence: the share of them within tolerance of the median"""
+
+    def __init__(self, size=3, tolerance=3.0):
+        if size < 1 or size % 2 == 0:
+            raise ValueError(f'median filter size must be odd, not {size}')
+        self.size = size
+        self.tolerance = tolerance
+        self._window = collections.deque(maxlen=size)   # in arrival order
+        self._sorted = []                                # the same, sorted
+
+    def update(self, velocity, timestamp):
+        window, ordered = self._window, self._sorted
+        if len(window) == self.size:
+            del ordered[bisect.bisect_left(ordered, window[0])]
+        window.append(velocity)
+        bisect.insort(ordered, velocity)
+        median = ordered[len(ordered) // 2]
+        low = bisect.bisect_left(ordered, median - self.tolerance)
+        high = bisect.bisect_right(ordered, median + self.tolerance)
+        return median, (high - low) / len(ordered)
+
+
+class OutlierGate:
+    """passes readings within max_jump of the last accepted one; a jump is accepted only
+    once confirm readings in a row agree with it (within max_jump of each other).
+    while a jump is unconfirmed the last accepted speed is returned, with confidence 0
+    """
+
+    def __init__(self, max_jump=20.0, confirm=2):
+        self.max_jump = max_jump
+        self.confirm = confirm
+        self.accepted = None
+        self._candidate = None   # the latest reading of an unconfirmed jump
+        self._agreeing = 0       # readings in a row that agree with it
+
+    def update(self, velocity, timestamp):
+        if self.accepted is None or abs(velocity - self.accepted) <= self.max_jump:
+            self.accepted = velocity
+            self._candidate = None
+            return velocity, 1.0
+        if self._candidate is not None and abs(velocity - self._candidate) <= self.max_jump:
+            self._agreeing += 1
+        else:
+            self._agreeing = 1
+        self._candidate = velocity
+        if self._agreeing >= self.confirm:
+            self.accepted = velocity
+            self._candidate = None
+            return velocity, 1.0
+        return self.accepted, 0.0
+
+
+class AlphaBetaFilter:
+    """alpha-beta tracker: speed and its rate of change, corrected by each reading
+
+    alpha -- share of the residual applied to the speed (0..1; smaller is smoother)
+    beta  -- share of the residual (per sec) applied to the rate of change
+    scale -- residual at which the confidence is 0.5
+    step  -- the speed returned is rounded to a multiple of this, so that, as with the
+             sensor's own readings, the tracker sees no acceleration in tiny changes; 0 for none
+    A zero (no target) or a change of direction resets it, so a vehicle's speed and rate
+    never carry over to the next one: smoothed, they bridged short gaps and merged vehicles.
+    """
+
+    def __init__(self, alpha=0.5, beta=0.01, scale=5.0, step=1.0):
+        self.alpha = alpha
+        self.beta = beta
+        self.scale = scale
+        self.step = step
+        self.speed = None
+        self.rate = 0.0
+        self._time = None
+
+    def update(self, velocity, timestamp):
+        if not velocity:   # no target: the next one starts afresh, not from this one's speed and rate
+            self.speed = None
+            return velocity, 1.0
+        if self.speed is None or (velocity > 0) != (self.speed > 0):   # (a change of direction is another target)
+            self.speed, self.rate, self._time = velocity, 0.0, timestamp
+            return velocity, 1.0
+        dt = timestamp - self._time
+        self._time = timestamp
+        predicted = self.speed + self.rate * dt
+        residual = velocity - predicted
+        self.speed = predicted + self.alpha * residual
+        if dt > 0:
+            self.rate += self.beta * residual / dt
+        ratio = residual / self.scale
+        speed = round(self.speed / self.step) * self.step if self.step else self.speed
+        return speed, 1.0 / (1.0 + ratio * ratio)
+
+
+class FilterChain:
+    """filters applied one after the other; the confidence is the lowest of theirs"""
+
+    def __init__(self, filters):
+        self.filters = list(filters)
+
+    def update(self, velocity, timestamp):
+        confidence = 1.0
+        for stage in self.filters:
+            velocity, stage_confidence = stage.update(velocity, timestamp)
+            if stage_confidence < confidence:
+                confidence = stage_confidence
+        return velocity, confidence
+
+
+FILTERS = {
+    'median': lambda size=3, tolerance=3.0: MedianFilter(int(size), tolerance),
+    'gate': lambda max_jump=20.0, confirm=2: OutlierGate(max_jump, int(confirm)),
+    'alphabeta': AlphaBetaFilter,
+}
+
+
+def make_filter(spec):
+    """a new filter from a spec like "median:5" or "gate:20,median:3" (see the top of this file).
+    None for an empty spec or "none"
+    """
+    if not spec or spec == 'none':
+        return None
+    filters = []
+    for part in spec.split(','):
+        name, *values = part.strip().split(':')
+        if name not in FILTERS:
+            raise ValueError(f'unknown speed filter {name!r}; one of {", ".join(FILTERS)}')
+        filters.append(FILTERS[name](*(float(value) for value in values)))
+    return filters[0] if len(filters) == 1 else FilterChain(filters)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+#####################################################
+#
+# Description: durable, compact record of every target (vehicle), with fast queries
+#
+# Each acquired target is stored as one fixed-width 32 byte record:
+#   start, end (unix time), peak and mean speed (abs, in the sensor's units),
+#   readings count, direction (1 inbound, -1 outbound), how it ended, sensor number
+# Records are appended to one file per day (UTC, by start time) in a directory:
+#   targets-2024-05-01.dat   the records, after a short header
+#   targets-2024-05-01.idx   per block of BLOCK_RECORDS records: earliest/latest start, top peak
+#   sensors.txt              sensor names; line n is sensor number n
+# TargetStore.add() only queues a record; a background thread writes the queue and
+# fsyncs every FLUSH_INTERVAL secs, so the tracking loop never waits for the disk.
+# A torn record at the end of a file (power cut mid-write) is cut off when the file is
+# next opened, and the index is rebuilt from the records then.
+#
+# TargetReader memory-maps the files and uses the index to skip whole days and blocks
+# outside the query, so months of records are searched in milliseconds:
+#   python target_store.py DIR --since 2024-05-01 --until 2024-06-01 --over 50
+#####################################################
+import argparse
+import calendar
+import collections
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+import metrics
+
+# start, end, peak, mean, count, direction, ended (ENDINGS index), sensor number
+RECORD = struct.Struct('<ddffIbbH')
+# per block: earliest start, latest start, top peak
+INDEX_ENTRY = struct.Struct('<ddf')
+MAGIC = b'OPSTGT01'
+HEADER = struct.Struct('<8sI4x')   # magic, record size
+BLOCK_RECORDS = 256
+FLUSH_INTERVAL = 5.0   # secs between writes (and fsyncs) of queued records
+ENDINGS = ('lost', 'direction', 'stopped')
+
+TargetRecord = collections.namedtuple('TargetRecord', 'start end peak mean count direction ended sensor')
+
+TARGETS_STORED = metrics.counter('ops_radar_targets_stored_total', 'targets written to the target store')
+STORE_FLUSH_SECONDS = metrics.histogram('ops_radar_target_store_flush_seconds',
+                                        'time taken to write and fsync queued targets')
+
+
+def day_of(timestamp):
+    """'YYYY-MM-DD' (UTC) of a unix time"""
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+def day_start(day):
+    """unix time at the start of 'YYYY-MM-DD' (UTC)"""
+    return calendar.timegm(time.strptime(day, '%Y-%m-%d'))
+
+
+def data_path(directory, day):
+    return os.path.join(directory, f'targets-{day}.dat')
+
+
+def index_path(directory, day):
+    return os.path.join(directory, f'targets-{day}.idx')
+
+
+def read_sensor_names(directory):
+    try:
+        with open(os.path.join(directory, 'sensors.txt')) as names:
+            return names.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+class _DayFile:
+    """the data and index files of one day, open for appending"""
+
+    def __init__(self, directory, day):
+        self.day = day
+        self.data = open(data_path(directory, day), 'a+b')
+        self.data.seek(0, os.SEEK_END)
+        size = self.data.tell()
+        if size < HEADER.size:
+            self.data.truncate(0)
+            self.data.write(HEADER.pack(MAGIC, RECORD.size))
+            size = HEADER.size
+        whole = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+        if whole != size:   # a record was cut short
+            logging.warning(f'target store {day}: dropping {size - whole} bytes of a torn record')
+            self.data.truncate(whole)
+        self.data.seek(0)
+        records = list(RECORD.iter_unpack(self.data.read()[HEADER.size:whole]))
+        self.data.seek(0, os.SEEK_END)
+        # the index is rebuilt rather than trusted, it may be behind the data after a crash
+        self.index = open(index_path(directory, day), 'wb')
+        self.block = []   # (start, peak) of the records in the unfinished block
+        for record in records:
+            self._indexed(record[0], record[2])
+        self.index.flush()
+
+    def _indexed(self, start, peak):
+        self.block.append((start, peak))
+        if len(self.block) == BLOCK_RECORDS:
+            starts = [start for start, _ in self.block]
+            self.index.write(INDEX_ENTRY.pack(min(starts), max(starts), max(peak for _, peak in self.block)))
+            self.block = []
+
+    def append(self, packed_records):
+        self.data.write(b''.join(packed_records))
+        for packed in packed_records:
+            record = RECORD.unpack(packed)
+            self._indexed(record[0], record[2])
+
+    def sync(self):
+        for f in (self.data, self.index):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class TargetStore:
+    """appends target records to the files in directory (created if need be)
+
+    add() is cheap and never blocks on the disk.  close() writes what is queued.
+    """
+
+    def __init__(self, directory, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self.sensor_numbers = {name: number for number, name in enumerate(read_sensor_names(directory))}
+        self._queue = []   # (day, packed record)
+        self._cond = threading.Condition()
+        self._closing = False
+        self._day_file = None
+        self._write_lock = threading.Lock()   # flush() may be called while the thread flushes
+        self._thread = threading.Thread(target=self._run, name='target-store', daemon=True)
+        self._thread.start()
+
+    def add(self, sensor_id, stats, ended):
+        """queue a record of a target.  stats is a tracker.TargetStats, ended one of ENDINGS"""
+        sensor = self.sensor_numbers.get(sensor_id)
+        if sensor is None:
+            sensor = self._add_sensor(sensor_id)
+        packed = RECORD.pack(stats.first_time, stats.last_time, stats.peak, stats.mean, stats.count,
+                             stats.direction, ENDINGS.index(ended), sensor)
+        with self._cond:
+            self._queue.append((day_of(stats.first_time), packed))
+
+    def _add_sensor(self, sensor_id):
+        number = len(self.sensor_numbers)
+        with open(os.path.join(self.directory, 'sensors.txt'), 'a') as names:
+            names.write(f'{sensor_id}\n')
+        self.sensor_numbers[sensor_id] = number
+        return number
+
+    def flush(self):
+        """write and fsync the queued records now"""
+        with self._cond:
+            queued, self._queue = self._queue, []
+        if not queued:
+            return
+        started = time.perf_counter()
+        with self._write_lock:
+            day_records = []
+            for day, packed in queued:
+                if self._day_file is None or day != self._day_file.day:
+                    self._write(day_records)
+                    day_records = []
+                    if self._day_file is not None:
+                        self._day_file.close()
+                    self._day_file = _DayFile(self.directory, day)
+                day_records.append(packed)
+            self._write(day_records)
+        TARGETS_STORED.inc(len(queued))
+        STORE_FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    def _write(self, packed_records):
+        if packed_records:
+            self._day_file.append(packed_records)
+            self._day_file.sync()
+
+    def close(self, timeout=5.0):
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if self._day_file is not None:
+            self._day_file.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closing:
+                    self._cond.wait(self.flush_interval)
+                closing = self._closing
+            try:
+                self.flush()
+            except OSError:
+                logging.exception('target store: write failed')   # the records stay lost; keep going
+            if closing:
+                return
+
+
+class TargetReader:
+    """queries the target records in a directory written by TargetStore"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sensor_names = read_sensor_names(directory)
+
+    def days(self):
+        """the days with records, in order"""
+        return sorted(name[len('targets-'):-len('.dat')] for name in os.listdir(self.directory)
+                      if name.startswith('targets-') and name.endswith('.dat'))
+
+    def query(self, since=None, until=None, over=None, sensor=None):
+        """TargetRecords of the targets that started in [since, until) (unix times, None for no limit),
+        with a peak speed over `over` and from the sensor named `sensor`, oldest file first
+        """
+        sensor_number = None
+        if sensor is not None:
+            if sensor not in self.sensor_names:
+                return
+            sensor_number = self.sensor_names.index(sensor)
+        for day in self.days():
+            first = day_start(day)
+            if (until is not None and first >= until) or (since is not None and first + 86400 <= since):
+                continue
+            yield from self._query_day(day, since, until, over, sensor_number)
+
+    def _query_day(self, day, since, until, over, sensor_number):
+        with open(data_path(self.directory, day), 'rb') as data:
+            size = os.fstat(data.fileno()).st_size
+            count = (size - HEADER.size) // RECORD.size if size > HEADER.size else 0
+            if not count:
+                return
+            with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                magic, record_size = HEADER.unpack_from(view)
+                if magic != MAGIC or record_size != RECORD.size:
+                    logging.warning(f'target store {day}: not a target file of this version, skipped')
+                    return
+                blocks = self._blocks(day, count)
+                for block, (earliest, latest, peak) in enumerate(blocks):
+                    if ((since is not None and latest < since) or (until is not None and earliest >= until)
+                            or (over is not None and peak <= over)):
+                        continue
+                    begin = HEADER.size + block * BLOCK_RECORDS * RECORD.size
+                    end = min(begin + BLOCK_RECORDS * RECORD.size, HEADER.size + count * RECORD.size)
+                    for record in RECORD.iter_unpack(view[begin:end]):
+                        if ((since is not None and record[0] < since) or (until is not None and record[0] >= until)
+                                or (over is not None and record[2] <= over)
+                                or (sensor_number is not None and record[7] != sensor_number)):
+                            continue
+                        yield self._record(record)
+
+    def _blocks(self, day, count):
+        """index entries covering all count records; the last, unindexed block can't be ruled out"""
+        try:
+            with open(index_path(self.directory, day), 'rb') as index:
+                blocks = list(INDEX_ENTRY.iter_unpack(index.read()))
+        except FileNotFoundError:
+            blocks = []
+        # (trailing bytes of an index being written are cut off by iter_unpack's size check)
+        blocks = blocks[:count // BLOCK_RECORDS]
+        full_blocks = (count + BLOCK_RECORDS - 1) // BLOCK_RECORDS
+        unbounded = (float('-inf'), float('inf'), float('inf'))
+        return blocks + [unbounded] * (full_blocks - len(blocks))
+
+    def _record(self, record):
+        start, end, peak, mean, count, direction, ended, sensor = record
+        name = self.sensor_names[sensor] if sensor < len(self.sensor_names) else str(sensor)
+        return TargetRecord(start, end, peak, mean, count, direction, ENDINGS[ended], name)
+
+
+def parse_time(text):
+    """'YYYY-MM-DD', 'YYYY-MM-DDTHH:MM:SS' (UTC) or a unix time"""
+    for pattern in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(text, pattern))
+        except ValueError:
+            pass
+    return float(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='query the target records written by ops_radar --target-store')
+    parser.add_argument('directory')
+    parser.add_argument('--since', type=parse_time, help='YYYY-MM-DD[THH:MM:SS] (UTC) or unix time')
+    parser.add_argument('--until', type=parse_time, help='YYYY-MM-DD[THH:MM:SS] (UTC) or unix time')
+    parser.add_argument('--over', type=float, help='only targets with a peak speed over this')
+    parser.add_argument('--sensor', help='only targets seen by this sensor (port name)')
+    parser.add_argument('--count', action='store_true', help='print only how many targets matched')
+    args = parser.parse_args()
+    records = TargetReader(args.directory).query(args.since, args.until, args.over, args.sensor)
+    if args.count:
+        print(sum(1 for _ in records))
+    else:
+        for r in records:
+            print(f'{time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(r.start))}Z {r.end - r.start:6.1f}s '
+                  f'{"in " if r.direction > 0 else "out"} peak {r.peak:5.1f} mean {r.mean:5.1f} '
+                  f'readings {r.count:4d} {r.ended:9s} {r.sensor}')
@@ -0,0 +1,301 @@
+#####################################################
+#
+# Description: the OPS24x target tracking state machine
+#
+# Tracker holds the not-tracking/tracking state that used to live in ops_radar.main_loop.
+# It is fed one velocity at a time together with the time that reading was taken,
+# and returns the handler events the reading produced (plus a TARGET_ENDED event with
+# the numbers of each acquired target when it ends).  It never reads the clock
+# or the sensor itself, so the same readings give the same events whether they come
+# from a live sensor, a replayed recording at full CPU speed, or a shard of a
+# recording processed in another process.
+#####################################################
+import collections
+import logging
+
+# one handler call produced by the tracker:
+#   name      -- handler function name, e.g. 'on_target_acquired'
+#   args      -- arguments for the handler
+#   timestamp -- time of the reading that caused the event
+#   stats     -- TargetStats of the target the event is about (a copy, as of the event), or None
+Event = collections.namedtuple('Event', 'name args timestamp stats', defaults=(None,))
+
+# the states time is accounted to: not tracking, tracking (not yet acquired), target acquired
+STATES = ('idle', 'tracking', 'acquired')
+
+# the thresholds of a Tracker, which reconfigure() can change while it is tracking
+SETTINGS = ('min_speed', 'max_speed', 'idle_notice_interval', 'targetless_min_interval', 'min_track_to_acquired')
+
+# not a handler: produced when an acquired target ends, with args (reason,) and its stats.
+# reason is 'lost', 'direction' (another target, the other way) or 'stopped' (see finish())
+TARGET_ENDED = 'target_ended'
+
+
+class TargetStats:
+    """running numbers of one target, from the reading that started tracking it
+
+    first_time, last_time -- times of its first and latest readings
+    count                 -- readings of it
+    peak, mean            -- of its speeds (abs)
+    variance, stdev       -- of its speeds (Welford's running method, so no readings are kept)
+    direction             -- 1 for inbound (positive speeds), -1 for outbound
+    """
+    __slots__ = ('first_time', 'last_time', 'count', 'peak', 'mean', '_m2', 'direction')
+
+    def __init__(self, velocity, timestamp):
+        self.first_time = self.last_time = timestamp
+        self.count = 1
+        self.peak = self.mean = abs(velocity)
+        self._m2 = 0.0
+        self.direction = 1 if velocity > 0 else -1
+
+    def add(self, velocity, timestamp):
+        speed = abs(velocity)
+        self.last_time = timestamp
+        self.count += 1
+        delta = speed - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (speed - self.mean)
+        if speed > self.peak:
+            self.peak = speed
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return self.variance ** 0.5
+
+    @property
+    def duration(self):
+        return self.last_time - self.first_time
+
+    def copy(self):
+        other = TargetStats.__new__(TargetStats)
+        other.first_time = self.first_time
+        other.last_time = self.last_time
+        other.count = self.count
+        other.peak = self.peak
+        other.mean = self.mean
+        other._m2 = self._m2
+        other.direction = self.direction
+        return other
+
+    def __repr__(self):
+        return (f'TargetStats(direction={self.direction}, count={self.count}, duration={self.duration:.2f}, '
+                f'peak={self.peak}, mean={self.mean:.2f}, stdev={self.stdev:.2f})')
+
+
+class Tracker:
+    """
+    there are two important states, not-tracking and tracking.
+    when not tracking, wait for a reading of an object worth tracking
+    when tracking, analyze, and when appropriate, produce an event for a handler.
+
+    Parameters (defaults are the ones for roadside use):
+    min_speed, max_speed -- speeds (abs) allowed to be tracked; anything outside is ignored
+    idle_notice_interval -- secs between idle notices while not tracking; 0 for none
+    targetless_min_interval -- grace period for an object to track again (hysteresis)
+    min_track_to_acquired -- min secs an object needs to be tracked for it to be counted
+
+    state is one of STATES; state_seconds accumulates the time spent in each
+    (see time_in_states() for totals that include the current state)
+    target is the TargetStats of the target being tracked, if any
+    """
+
+    def __init__(self, min_speed=10, max_speed=75, idle_notice_interval=10.0,
+                 targetless_min_interval=0.75, min_track_to_acquired=0.1):
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.idle_notice_interval = idle_notice_interval
+        self.targetless_min_interval = targetless_min_interval
+        self.min_track_to_acquired = min_track_to_acquired
+
+        # state machine variables
+        self.tracking = False
+        self.target_acquired = False
+        self.recent_velocity = 0.0
+        self.prior_velocity = 0.0
+        self.idle_start_time = None        # set by the first reading
+        self.tracking_start_time = None
+        self.targetless_start_time = None
+        self.state = 'idle'
+        self.state_since = None            # set by the first reading
+        self.state_seconds = dict.fromkeys(STATES, 0.0)
+        self.last_time = None              # time of the latest reading
+        self.target = None
+
+    def settings(self):
+        return {name: getattr(self, name) for name in SETTINGS}
+
+    def reconfigure(self, **settings):
+        """change thresholds (SETTINGS) between readings.  the state, and any target, are kept"""
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise TypeError(f'not a tracker setting: {", ".join(sorted(unknown))}')
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+    def is_speed_in_allowed(self, velocity):
+        """True if min_speed < abs(velocity) < max_speed"""
+        return self.min_speed < abs(velocity) < self.max_speed
+
+    def time_in_states(self):
+        """{state: secs spent in it}, up to the latest reading"""
+        totals = dict(self.state_seconds)
+        if self.state_since is not None:
+            totals[self.state] += self.last_time - self.state_since
+        return totals
+
+    def finish(self):
+        """Events for the end of the target being tracked, if it was acquired (e.g. when stopping)"""
+        if not self.target_acquired:
+            return []
+        return [Event(TARGET_ENDED, ('stopped',), self.last_time, self.target.copy())]
+
+    def _enter(self, state, now):
+        # only called on transitions, so keeping time costs nothing per reading
+        self.state_seconds[self.state] += now - self.state_since
+        self.state = state
+        self.state_since = now
+
+    def feed(self, velocity, timestamp):
+        """process one reading taken at timestamp (secs).  returns a list of Events"""
+        events = []
+        self.last_time = timestamp
+        if self.tracking:
+            self._track(velocity, timestamp, events)
+        else:
+            self._wait_for_target(velocity, timestamp, events)
+        return events
+
+    def feed_many(self, readings):
+        """process (velocity, timestamp) pairs in order.  returns all the Events produced
+
+        velocities of None (nothing received) are skipped
+        """
+        events = []
+        for velocity, timestamp in readings:
+            if velocity is None:
+                continue
+            self.last_time = timestamp
+            if self.tracking:
+                self._track(velocity, timestamp, events)
+            else:
+                self._wait_for_target(velocity, timestamp, events)
+        return events
+
+    def _wait_for_target(self, velocity, now, events):
+        # not tracking: the first speed report in range moves us to tracking
+        if self.idle_start_time is None:
+            self.idle_start_time = self.state_since = now
+        self.recent_velocity = velocity
+        is_valid_speed = self.is_speed_in_allowed(velocity)
+        logging.debug('not tracking.  received speed:%s (%s)', abs(velocity), is_valid_speed)
+        if is_valid_speed:
+            # Begin tracking
+            self.tracking = True
+            self.target_acquired = False
+            self.targetless_start_time = self.tracking_start_time = now
+            self.target = TargetStats(velocity, now)
+            self._enter('tracking', now)
+            logging.debug('NOW move to tracking.  received speed:%s', abs(velocity))
+        elif self.idle_notice_interval > 0:
+            # only if idle_notice_interval do we do idle notices
+            if now - self.idle_start_time > self.idle_notice_interval:
+                events.append(Event('on_idle_notice_interval', (), now))
+                logging.debug('notice: still idle')
+                # Reset wait timer
+                self.idle_start_time = now
+
+    def _track(self, velocity, now, events):
+        # Tracking has sub-conditions of acquiring ("just tracking") and target-acquired
+        # if there's an object that has stayed consistent for a length of time,
+        # it is called "target-acquired"
+        # transitions
+            # upon consistent reading (>min_track_to_acquired, no direction change),  not-acq to acq
+            # upon change of direction   if new speed is allowed, acq to not-acq. if out, tracking=false
+            # upon speed-out-of-range for more than an allowable time, tracking = false
+        prior_velocity = self.prior_velocity = self.recent_velocity
+        recent_velocity = self.recent_velocity = velocity
+        logging.debug('analyze received speed:%s', abs(recent_velocity))
+
+        if self.is_speed_in_allowed(recent_velocity):
+            # The instant the direction changes, old tracking ends
+            if (prior_velocity > 0 and recent_velocity > 0) or \
+                    (prior_velocity < 0 and recent_velocity < 0):
+                # This should be the most common case when observing a target
+
+                # Reset targetless wait timer
+                self.targetless_start_time = None  # we most definitely have a target
+                self.target.add(recent_velocity, now)
+
+                # Check if tracking time is long enough to be valid
+                if (now - self.tracking_start_time) > self.min_track_to_acquired:
+                    if not self.target_acquired:
+                        events.append(Event('on_target_acquired', (recent_velocity,), now, self.target.copy()))
+                        if recent_velocity > 0:  # motion inbound
+                            logging.info(f"First acquire of inbound motion (speed {recent_velocity})")
+                        else:  # motion outbound
+                            logging.info(f"First acquire of outbound motion (speed {recent_velocity})")
+                        self.target_acquired = True
+                        self._enter('acquired', now)
+                    elif abs(recent_velocity) > abs(prior_velocity):
+                        # target still acquired, and speeding up
+                        logging.info(f"Acceleration detected (speed {recent_velocity})")
+                        events.append(Event('on_target_accelerating', (recent_velocity,), now, self.target.copy()))
+                    # elif abs(recent_velocity) < abs(prior_velocity):
+                    #     logging.info(f"Deceleration detected (speed {recent_velocity})")
+                    #     events.append(Event('on_target_decelerating', (recent_velocity,), now, self.target.copy()))
+
+            else:  # not the same sign (thus not the same direction)
+                # Direction changed!
+                # So, this immediately stops tracking one target and starts tracking another
+                # which has similar logic to going thru tracking/not-acquired and then acquired.
+                if self.target_acquired:  # well, it is not acquired now
+                    # possible cases:
+                    #   Tracking was valid and object is going past us.  Simple choice: declare new object.
+                    #   A new object is coming opposite direction.  Simple choice: immediately decree the old object is gone
+                    self.target_acquired = False  # future policy improvement: don't do this immediately?
+                    events.append(Event(TARGET_ENDED, ('direction',), now, self.target))   # (a new target starts below)
+                    self._enter('tracking', now)
+                    if recent_velocity > 0:  # motion changed to inbound
+                        logging.info('direction changed. motion now inbound')
+                    else:  # motion outbound
+                        logging.info('direction changed. motion now outbound')
+                else:
+                    logging.info('Direction changed before tracking lock, restart tracking')
+
+                # Reset valid tracking and continue to track new object
+                self.targetless_start_time = now  # it could be the start of targetless
+                self.tracking_start_time = now    # or even the start of tracking
+                self.target = TargetStats(recent_velocity, now)
+
+        else:  # velocity is out of allowed range
+            logging.debug('speed %s outside of allowed range', abs(velocity))
+            if self.targetless_start_time is None:
+                self.targetless_start_time = now
+            elif now - self.targetless_start_time > self.targetless_min_interval:
+                # declare giving up on target if time expired
+                if self.target_acquired:
+                    # some target was acquired, but apparently object went out of range
+                    # because now we have out-of-range speed
+                    # WARN: it could be a very long time between reporting events if the target
+                    # goes out of range (like walks behind) so this is not the ideal way to report.
+                    # (no copy needed: the target is done with)
+                    events.append(Event('on_target_lost', (), now, self.target))
+                    events.append(Event(TARGET_ENDED, ('lost',), now, self.target))
+                    if recent_velocity > 0:
+                        # just captured motion was inbound.  could have changed though, it's a low reading
+                        logging.info('target lost.  seeing disallowed inbound')
+                    elif recent_velocity < 0:
+                        logging.info('target lost.  seeing disallowed outbound')
+                    else:
+                        logging.info('target lost.  seeing zeros')
+                # back to not tracking
+                self.target_acquired = False
+                self.tracking = False
+                self.idle_start_time = now
+                self.target = None
+                self._enter('idle', now)